@@ -0,0 +1,122 @@
+import argparse
+import json
+import os
+import random
+from datetime import datetime, timedelta
+
+from scripts.connections import transaction
+from scripts.database import ManagerRepository, UserRepository
+
+"""
+ Synthetic data for the benchmarks, fills a database folder with rooms, forum messages, requests and complaints
+ dates are spread over the last two years so the forum has a previous year as well as the current one
+
+ usage: python -m benchmarks.generate out_dir --rooms 200 --messages 20000 --requests 20000
+"""
+
+SERVICES = ['Plumbing', 'Electrician', 'Cleaning', 'Technician']
+CATEGORIES = ['Service', 'Maintenance', 'Noise', 'Pest', 'Other']
+WORDS = ('water leak lift broken noise party parking light power cleaning garden pest gate door bill meeting '
+         'tomorrow tonight please thanks anyone floor room window heater repair').split()
+
+# share of complaints and services which are still open
+OPEN = 0.05
+
+# password every generated resident has, it passes the sign-up rules
+PASSWORD = 'resident@1'
+
+
+def room(i):
+    # room numbers of the form ***L
+    return f'{100 + i // 26 % 900:03d}{chr(65 + i % 26)}'
+
+
+def sentence(rand, n):
+    return ' '.join(rand.choice(WORDS) for _ in range(n))
+
+
+def dates(rand, n, days=730):
+    # n datetimes in increasing order over the last few days
+    now = datetime.now()
+    return sorted(now - timedelta(seconds=rand.randrange(days * 86400)) for _ in range(n))
+
+
+def generate(out, rooms=200, messages=20000, requests=20000, legacy_json=False, seed=0):
+
+    """
+    creates out/users.db and out/manager_dat.db (and out/complaints.json if legacy_json)
+    roughly a third of the requests are complaints, the rest are services
+    :return: dictionary of how many rows were made
+    """
+
+    rand = random.Random(seed)
+    os.makedirs(out, exist_ok=True)
+    rooms = [room(i) for i in range(rooms)]
+
+    users = UserRepository(os.path.join(out, 'users.db'))
+    with transaction(users.dbcon):
+        users.dbcon.executemany('INSERT OR IGNORE INTO users VALUES (?, ?)', [(r, PASSWORD) for r in rooms])
+
+    # with legacy_json the complaints are written to complaints.json afterwards, so the first Manager imports them
+    complaints = []
+    db = ManagerRepository(os.path.join(out, 'manager_dat.db'))
+
+    with transaction(db.dbcon):
+        db.dbcon.executemany('INSERT INTO forum VALUES (?, ?, ?)',
+                             [(rand.choice(rooms), d.strftime('%Y-%m-%d %H:%M:%S'),
+                               sentence(rand, rand.randint(3, 25))) for d in dates(rand, messages)])
+
+        for d in dates(rand, requests):
+            r = rand.choice(rooms)
+            day = d.strftime('%Y-%m-%d')
+
+            if rand.random() < 1 / 3:
+                db.dbcon.execute('INSERT INTO requests VALUES (?, ?, ?, ?)', ('complaint', r, day, '-'))
+                complaint = {'room': r, 'cat': rand.sample(CATEGORIES, rand.randint(1, 2)),
+                             'sub': sentence(rand, 3), 'con': sentence(rand, rand.randint(10, 60))}
+                if legacy_json:
+                    complaints.append(complaint)
+                else:
+                    db.complaints.insert(complaint['room'], complaint['cat'], complaint['sub'], complaint['con'],
+                                         date=day)
+
+            else:
+                service = rand.choice(SERVICES)
+                db.dbcon.execute('INSERT INTO requests VALUES (?, ?, ?, ?)', ('service', r, day, service))
+                db.dbcon.execute('INSERT INTO services(service, room, date, sched, call) VALUES (?, ?, ?, ?, ?)',
+                                 (service, r, day, (d + timedelta(days=rand.randint(1, 30))).strftime('%Y-%m-%d'),
+                                  rand.random() < 0.5))
+
+        # most of the history is resolved, the rest waits in the triage queues with any priority
+        for table, key in [('complaints', 'id'), ('services', 'rowid')]:
+            rows = db.dbcon.execute(f'SELECT {key} FROM {table}').fetchall()
+            db.dbcon.executemany(f'UPDATE {table} SET status = ?, priority = ? WHERE {key} = ?',
+                                 [('open' if rand.random() < OPEN else 'resolved', rand.randint(1, 4), i)
+                                  for i, in rows])
+
+    if legacy_json:
+        with open(os.path.join(out, 'complaints.json'), 'w') as f:
+            json.dump({f'c{i}': c for i, c in enumerate(complaints)}, f)
+
+    db.dbcon.close()
+    users.dbcon.close()
+
+    return {'rooms': len(rooms), 'messages': messages, 'requests': requests}
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Fill a database folder with synthetic data.')
+    parser.add_argument('out', help='folder to create the databases in')
+    parser.add_argument('--rooms', type=int, default=200)
+    parser.add_argument('--messages', type=int, default=20000)
+    parser.add_argument('--requests', type=int, default=20000)
+    parser.add_argument('--legacy-json', action='store_true', help='write complaints to complaints.json instead')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    print(generate(args.out, args.rooms, args.messages, args.requests, args.legacy_json, args.seed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,285 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, timedelta
+from time import perf_counter
+
+from benchmarks.generate import generate, PASSWORD, SERVICES, CATEGORIES
+from benchmarks.run import summary
+from scripts.connections import is_locked, lock_report, retry
+from scripts.database import ManagerRepository, UserRepository
+from scripts.scheduling import FullyBooked
+from scripts.worker import DBWorker
+
+"""
+ Load test, a whole building using the databases at once
+ every simulated resident is a thread with its own connections, the same as a window, which logs in
+ and then posts to the forum, books services and files complaints at random with the chosen mix,
+ waiting a random time between actions so each resident does rate actions a second on average
+ residents can be spread over several processes, each process holding its own writer connections like
+ separate windows do, and writes go through the database worker's retry the same way the windows' writes do
+
+ reported: p50/p95/p99 latency of every action, throughput, lock errors (writes which stayed locked after
+ every retry) and lost writes (writes which were acknowledged but are not in the database afterwards)
+ the results can be compared like the other benchmarks: python -m benchmarks.run --compare old.json new.json
+
+ usage: python -m benchmarks.load --residents 200 --duration 30 --rate 1
+        python -m benchmarks.load --residents 400 --processes 4 --mix forum=6,service=1,complaint=1,login=2
+        python -m benchmarks.load --db-dir database --password resident@1
+"""
+
+# relative weights of the actions
+MIX = {'login': 2, 'forum': 4, 'service': 2, 'complaint': 1}
+
+# services are booked up to this many days ahead, so most bookings fit under the daily capacity
+BOOKING_DAYS = 365
+
+# seconds for the processes to start before the residents begin together
+WARMUP = 2
+
+
+def parse_mix(text):
+
+    # 'forum=4,service=2' -> {'forum': 4.0, 'service': 2.0}
+
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        if name not in MIX:
+            raise argparse.ArgumentTypeError(f'unknown action {name}, actions are {", ".join(MIX)}')
+        mix[name] = float(weight or 1)
+    return mix
+
+
+class Resident(threading.Thread):
+
+    def __init__(self, number, room, db_dir, mix, rate, start, until, password, seed):
+
+        super().__init__(daemon=True)
+        self.tag = f'{os.getpid()}-{number}'
+        self.room = room
+        self.db_dir = db_dir
+        self.actions, self.weights = list(mix), list(mix.values())
+        self.rate = rate
+        self.start_at = start
+        self.until = until
+        self.password = password
+        self.rand = random.Random(seed)
+        self.count = 0
+
+        # seconds taken by every action, errors, and what was written once the write was acknowledged
+        self.latencies = {action: [] for action in MIX}
+        self.errors = {'locked': 0, 'failed': 0, 'login_failed': 0, 'fully_booked': 0}
+        self.written = {'forum': [], 'requests': [], 'complaints': []}
+
+    def run(self):
+
+        users = UserRepository(os.path.join(self.db_dir, 'users.db'), readonly=True)
+        manager = ManagerRepository(os.path.join(self.db_dir, 'manager_dat.db'))
+
+        try:
+            time.sleep(max(0.0, self.start_at - time.time()))
+            while True:
+                # waiting a random time between actions, rate actions a second on average
+                time.sleep(self.rand.expovariate(self.rate))
+                if time.time() >= self.until: break
+
+                action = self.rand.choices(self.actions, self.weights)[0]
+                self.count += 1
+                start = perf_counter()
+                try:
+                    getattr(self, action)(users, manager)
+                except FullyBooked:
+                    self.errors['fully_booked'] += 1
+                    continue
+                except sqlite3.OperationalError as e:
+                    self.errors['locked' if is_locked(e) else 'failed'] += 1
+                    continue
+                except Exception:
+                    self.errors['failed'] += 1
+                    continue
+                self.latencies[action].append(perf_counter() - start)
+        finally:
+            users.close()
+            manager.close()
+
+    @staticmethod
+    def write(manager, fn, *args):
+
+        # one write as the database worker makes it, in a transaction which is run again while the database is locked
+        (callback, result), = retry(DBWorker.run_batch, manager, [(fn, args, None, None)], stats=manager.stats)
+        if isinstance(result, Exception): raise result
+        return result
+
+    def login(self, users, manager):
+        # what the login window checks
+        if not users.check(self.room, self.password):
+            self.errors['login_failed'] += 1
+
+    def forum(self, users, manager):
+        content = f'load {self.tag} {self.count}'
+        self.write(manager, ManagerRepository.add_message, self.room, content)
+        self.written['forum'].append(content)
+
+    def service(self, users, manager):
+        day = date.today() + timedelta(days=self.rand.randint(1, BOOKING_DAYS))
+        row = self.write(manager, ManagerRepository.add_service, self.room, self.rand.choice(SERVICES), str(day),
+                         self.rand.random() < 0.5)
+        self.written['requests'].append(row[0])
+
+    def complaint(self, users, manager):
+        sub = f'load {self.tag} {self.count}'
+        row = self.write(manager, ManagerRepository.add_complaint, self.room,
+                         self.rand.sample(CATEGORIES, self.rand.randint(1, 2)), sub, 'load test complaint')
+        self.written['requests'].append(row[0])
+        self.written['complaints'].append(sub)
+
+
+def simulate(db_dir, residents, mix, rate, start, until, password, seed):
+
+    """
+    runs residents, a list of (number, room), as threads of this process
+    :return: latencies, errors, acknowledged writes and lock statistics of them all
+    """
+
+    threads = [Resident(number, room, db_dir, mix, rate, start, until, password, seed + number)
+               for number, room in residents]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    result = {'latencies': {action: [] for action in MIX}, 'errors': {}, 'actions': 0,
+              'written': {'forum': [], 'requests': [], 'complaints': []}, 'locks': lock_report()}
+    for t in threads:
+        result['actions'] += t.count
+        for action, samples in t.latencies.items():
+            result['latencies'][action] += samples
+        for name, n in t.errors.items():
+            result['errors'][name] = result['errors'].get(name, 0) + n
+        for table, rows in t.written.items():
+            result['written'][table] += rows
+    return result
+
+
+def lost_writes(db_dir, written):
+
+    # acknowledged writes which are not in the database
+
+    db = ManagerRepository(os.path.join(db_dir, 'manager_dat.db'), readonly=True)
+    try:
+        found = {
+            'forum': {c for c, in db.dbcon.execute("SELECT con FROM forum WHERE con LIKE 'load %' UNION ALL "
+                                                   "SELECT con FROM forum_archive WHERE con LIKE 'load %'")},
+            'requests': {r for r, in db.dbcon.execute('SELECT rowid FROM requests')},
+            'complaints': {s for s, in db.dbcon.execute("SELECT sub FROM complaints WHERE sub LIKE 'load %'")},
+        }
+    finally:
+        db.close()
+
+    return {table: sum(1 for row in rows if row not in found[table]) for table, rows in written.items()}
+
+
+def run(db_dir, residents, processes, mix, rate, duration, password, seed):
+
+    # residents are shared out over the processes, every process runs its share as threads
+
+    users = UserRepository(os.path.join(db_dir, 'users.db'), readonly=True)
+    rooms = [r for r, in users.dbcon.execute('SELECT rno FROM users ORDER BY rno')]
+    users.close()
+    if not rooms:
+        raise SystemExit(f'no residents in {db_dir}/users.db')
+
+    assigned = [(i, rooms[i % len(rooms)]) for i in range(residents)]
+    start = time.time() + WARMUP
+    until = start + duration
+
+    # spawned so every process opens its own connections from scratch, like a separate window
+    with ProcessPoolExecutor(processes, mp_context=multiprocessing.get_context('spawn')) as pool:
+        parts = [f.result() for f in [pool.submit(simulate, db_dir, assigned[i::processes], mix, rate, start, until,
+                                                  password, seed) for i in range(processes)]]
+
+    written = {table: [row for part in parts for row in part['written'][table]] for table in parts[0]['written']}
+    errors = {}
+    for part in parts:
+        for name, n in part['errors'].items():
+            errors[name] = errors.get(name, 0) + n
+
+    # lock statistics of every process together, the longest wait is the longest of any process
+    locks = {}
+    for part in parts:
+        for path, counts in part['locks'].items():
+            total = locks.setdefault(os.path.basename(path), dict.fromkeys(counts, 0))
+            for name, value in counts.items():
+                total[name] = max(total[name], value) if name == 'max_wait_ms' else total[name] + value
+
+    completed = sum(len(part['latencies'][action]) for part in parts for action in MIX)
+    return {
+        'actions': {action: summary(samples) for action in MIX
+                    if (samples := [s for part in parts for s in part['latencies'][action]])},
+        'attempted': sum(part['actions'] for part in parts),
+        'completed': completed,
+        'throughput_per_s': completed / duration,
+        'errors': errors,
+        'acknowledged': {table: len(rows) for table, rows in written.items()},
+        'lost_writes': lost_writes(db_dir, written),
+        'locks': locks,
+    }
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Simulate many residents using the databases at once.')
+    parser.add_argument('--residents', type=int, default=100)
+    parser.add_argument('--processes', type=int, default=1, help='processes the residents are spread over')
+    parser.add_argument('--duration', type=float, default=30, help='seconds the residents are active for')
+    parser.add_argument('--rate', type=float, default=0.5, help='actions a second of each resident, on average')
+    parser.add_argument('--mix', type=parse_mix, default=MIX,
+                        help='relative weights of the actions, e.g. login=2,forum=4,service=2,complaint=1')
+    parser.add_argument('--db-dir', help='folder with users.db and manager_dat.db to load, '
+                                         'a generated dataset in a temporary folder if not given')
+    parser.add_argument('--password', default=PASSWORD, help='password every resident logs in with')
+    parser.add_argument('--rooms', type=int, default=200)
+    parser.add_argument('--messages', type=int, default=20000)
+    parser.add_argument('--requests', type=int, default=20000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', help='json file for the results, printed if not given')
+    args = parser.parse_args()
+
+    settings = {'residents': args.residents, 'processes': args.processes, 'duration_s': args.duration,
+                'rate': args.rate, 'mix': args.mix}
+
+    with tempfile.TemporaryDirectory() as workdir:
+        db_dir = args.db_dir
+        if not db_dir:
+            db_dir = os.path.join(workdir, 'database')
+            settings['dataset'] = generate(db_dir, args.rooms, args.messages, args.requests, seed=args.seed)
+
+        results = run(db_dir, args.residents, args.processes, args.mix, args.rate, args.duration, args.password,
+                      args.seed)
+
+    report = {
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'settings': settings,
+        'results': results,
+    }
+
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,231 @@
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from time import perf_counter
+
+from benchmarks.generate import generate, room
+
+"""
+ Benchmark suite, times the Manager window and the write paths against a synthetic dataset
+ the window is opened for real, so without a display an Xvfb server is started (or run under xvfb-run)
+
+ measured:
+  manager startup steps and time to first paint
+  forum tab build time
+  send_message and register_complaint, time spent on the Tk thread
+  add_message and add_complaint, time until the write is committed
+  peak rss of the process
+
+ usage: python -m benchmarks.run --rooms 200 --messages 20000 --requests 20000 --out results.json
+        python -m benchmarks.run --compare old.json new.json
+"""
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def summary(samples):
+    # milliseconds statistics of a list of seconds
+    samples = sorted(samples)
+    pick = lambda q: samples[min(len(samples) - 1, int(q * len(samples)))] * 1000
+    return {'n': len(samples), 'mean': sum(samples) / len(samples) * 1000,
+            'p50': pick(0.5), 'p95': pick(0.95), 'p99': pick(0.99), 'max': samples[-1] * 1000}
+
+
+def ensure_display():
+
+    # starting a virtual display if there is none, returns the process so it can be stopped
+
+    if os.environ.get('DISPLAY'): return None
+    if not shutil.which('Xvfb'):
+        sys.exit('No display, install Xvfb or run under xvfb-run')
+
+    server = subprocess.Popen(['Xvfb', ':99', '-screen', '0', '1280x1024x24'],
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    os.environ['DISPLAY'] = ':99'
+    time.sleep(1)
+    return server
+
+
+def prepare(workdir, rooms, messages, requests, legacy_json):
+
+    # generating the dataset into workdir/database and pointing workdir/assets at the repo's assets
+
+    start = perf_counter()
+    sizes = generate(os.path.join(workdir, 'database'), rooms, messages, requests, legacy_json)
+    sizes['generate_s'] = perf_counter() - start
+
+    os.symlink(os.path.join(REPO, 'assets'), os.path.join(workdir, 'assets'))
+    os.chdir(workdir)
+    return sizes
+
+
+def bench_window(writes):
+
+    """
+    opens a Manager, builds the forum tab and sends messages and complaints through the window
+    :return: dictionary of results
+    """
+
+    from customtkinter import CTk
+    from scripts.manager import Manager
+
+    results = {}
+
+    class BenchManager(Manager):
+
+        def first_paint(self):
+            super().first_paint()
+            results['startup'] = {label: t * 1000 for label, t in self.timer.sections}
+            results['first_paint_ms'] = self.timer.marks[-1][1] * 1000
+            self.after(0, self.measure)
+
+        def measure(self):
+
+            with self.timer.section('forum'):
+                self.options.build('Forum')
+                self.update_idletasks()
+            results['forum_tab_ms'] = self.timer.sections[-1][1] * 1000
+
+            self.options.build('Complaints')
+
+            sends = []
+            for i in range(writes):
+                self.forum['con'].text.insert('0.0', f'benchmark message {i}')
+                start = perf_counter()
+                self.send_message()
+                sends.append(perf_counter() - start)
+            results['send_message_ui'] = summary(sends)
+
+            complaints = []
+            for i in range(writes):
+                self.complaints['sub'].entry.insert(0, f'benchmark {i}')
+                self.complaints['con'].text.insert('0.0', 'benchmark complaint')
+                self.complaints['cat'].options['Noise'].select()
+                start = perf_counter()
+                self.register_complaint()
+                complaints.append(perf_counter() - start)
+            results['register_complaint_ui'] = summary(complaints)
+
+            self.close()
+            self.master.destroy()
+
+    root = CTk()
+    BenchManager(root, room(0)).show()
+    root.mainloop()
+    return results
+
+
+def bench_writes(writes):
+
+    # committing writes straight through the repository, what the worker does for every job
+
+    from scripts.database import ManagerRepository
+
+    db = ManagerRepository('database/manager_dat.db')
+    results = {}
+
+    samples = []
+    for i in range(writes):
+        start = perf_counter()
+        db.add_message(room(1), f'benchmark message {i}')
+        samples.append(perf_counter() - start)
+    results['add_message'] = summary(samples)
+
+    samples = []
+    for i in range(writes):
+        start = perf_counter()
+        db.add_complaint(room(1), ['Noise'], f'benchmark {i}', 'benchmark complaint')
+        samples.append(perf_counter() - start)
+    results['add_complaint'] = summary(samples)
+
+    db.dbcon.close()
+    return results
+
+
+def flatten(results, prefix=''):
+    # {'a': {'b': 1}} -> {'a.b': 1}, numbers only
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f'{prefix}{key}.'))
+        elif isinstance(value, (int, float)):
+            flat[prefix + key] = value
+    return flat
+
+
+def compare(old, new):
+
+    # printing every number of two result files side by side
+
+    with open(old) as f:
+        a = flatten(json.load(f)['results'])
+    with open(new) as f:
+        b = flatten(json.load(f)['results'])
+
+    fmt = lambda v: '-' if v is None else f'{v:.3f}'
+
+    print(f'{"":40}{"old":>12}{"new":>12}{"change":>10}')
+    for key in sorted(a.keys() | b.keys()):
+        before, after = a.get(key), b.get(key)
+        change = f'{(after - before) / before * 100:+.1f}%' if before and after is not None else ''
+        print(f'{key:40}{fmt(before):>12}{fmt(after):>12}{change:>10}')
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Benchmark startup, tab building and writes.')
+    parser.add_argument('--rooms', type=int, default=200)
+    parser.add_argument('--messages', type=int, default=20000)
+    parser.add_argument('--requests', type=int, default=20000)
+    parser.add_argument('--writes', type=int, default=50, help='messages and complaints written in each test')
+    parser.add_argument('--legacy-json', action='store_true', help='start from a complaints.json to import')
+    parser.add_argument('--out', help='json file for the results, printed if not given')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='compare two result files')
+    args = parser.parse_args()
+
+    if args.compare:
+        return compare(*args.compare)
+
+    out = os.path.abspath(args.out) if args.out else None
+    server = ensure_display()
+
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            cwd = os.getcwd()
+            sizes = prepare(workdir, args.rooms, args.messages, args.requests, args.legacy_json)
+
+            results = bench_window(args.writes)
+            results.update(bench_writes(args.writes))
+            os.chdir(cwd)
+    finally:
+        if server: server.terminate()
+
+    # ru_maxrss is in kilobytes on linux
+    results['peak_rss_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    report = {
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'dataset': sizes,
+        'results': results,
+    }
+
+    if out:
+        with open(out, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,10 @@
-from scripts.home import Home
-from scripts.manager import Manager
+import argparse
+
+from scripts.app import App
 
 if __name__ == '__main__':
-    rno = Home().run() # gets room number
-    if rno:
-        Manager(rno) # opens manager
+    parser = argparse.ArgumentParser(description='Apartment management.')
+    parser.add_argument('--server', help='url of server.py, the databases are opened directly if not given')
+    args = parser.parse_args()
+
+    App(args.server).run() # login and management in one window
@@ -0,0 +1,78 @@
+import os
+
+from customtkinter import CTk
+
+from scripts.backup import BackupThread, BACKUP_DIR
+from scripts.home import Home
+from scripts.manager import Manager
+from scripts.shards import router
+from scripts.timing import Timer
+from scripts.trace import LagMonitor, ENABLED as TRACING
+
+"""
+ Application window, a single Tk root for the whole session which shows the login view and the management view
+ in place of each other, Tk and the theme are only set up once and decoded images stay in the asset registry,
+ so logging in only has to build the management view and logging out goes back to the login view
+"""
+
+# milliseconds a view is kept after it is hidden before destroying it,
+# customtkinter still runs the click animation of the button which switched views on it
+CLEANUP = 500
+
+
+class App(CTk):
+
+    def __init__(self, server=None):
+
+        self.timer = Timer('Application startup')
+        with self.timer.section('window'):
+            super().__init__()
+
+        self.server = server
+        self.manager = None
+
+        # the login view is kept for the whole session, the management view is made for every login
+        with self.timer.section('login view'):
+            self.home = Home(self, server, on_login=self.login)
+        self.home.show()
+
+        # snapshots of every building's databases are taken in the background once a day,
+        # by the server if there is one
+        # with several buildings each one's snapshots go in a folder of their own
+        self.backups = []
+        if not server:
+            directories = router.directories()
+            for directory in directories:
+                out = os.path.join(BACKUP_DIR, os.path.basename(directory)) if len(directories) > 1 else BACKUP_DIR
+                self.backups.append(BackupThread(directory, out))
+
+        # measuring how long the event loop stalls for when tracing
+        if TRACING:
+            LagMonitor(self, 'PyApartments')
+
+        # closing the views before the window, so their background work is stopped while Tk is still there
+        self.protocol('WM_DELETE_WINDOW', self.exit)
+
+    def login(self, room_number):
+        self.home.hide()
+        self.manager = Manager(self, room_number, self.server, on_logout=self.logout)
+        self.manager.show()
+
+    def logout(self):
+        manager, self.manager = self.manager, None
+        manager.close()
+        self.after(CLEANUP, manager.destroy)
+        self.home.show()
+
+    def exit(self):
+        if self.manager:
+            self.manager.close()
+        self.home.close()
+        # a snapshot being made is given up, so no half written one is left behind
+        for backup in self.backups:
+            backup.stop()
+        self.destroy()
+
+    def run(self):
+        self.timer.print_report()
+        self.mainloop()
@@ -0,0 +1,101 @@
+import os
+from collections import OrderedDict
+
+from PIL import Image
+from customtkinter import CTkImage
+
+"""
+ Asset registry, the assets folder is listed once and decoded images are kept in a bounded LRU cache
+ keyed by (name, size), so placing the same image again does not decode the file again
+ resized copies are also saved to a cache folder on disk, so the next launch only decodes the small copy
+"""
+
+
+class AssetRegistry:
+
+    def __init__(self, root='assets', cache_dir='assets/.cache', size=32, disk=True):
+
+        """
+        :param root: assets folder, with a sub folder for every type (images, ...)
+        :param cache_dir: folder for resized copies of images
+        :param size: most images kept in memory
+        :param disk: whether resized copies are saved to and read from cache_dir
+        """
+
+        self.root = root
+        self.cache_dir = cache_dir
+        self.size = size
+        self.disk = disk
+
+        # filenames of every type, listed the first time an asset is asked for
+        self.index = None
+
+        self.images = OrderedDict()
+
+    def build_index(self):
+
+        # listing every asset folder once
+
+        self.index = {}
+        for folder in os.listdir(self.root):
+            if folder.startswith('.') or not os.path.isdir(os.path.join(self.root, folder)): continue
+            self.index[folder] = sorted(os.listdir(os.path.join(self.root, folder)))
+
+    def path(self, type, filename):
+
+        # gets required asset from the given type and filename in the assets folder
+
+        if self.index is None:
+            self.build_index()
+
+        name = [f for f in self.index[f'{type}s'] if f.startswith(filename)][0]
+        return f'{self.root}/{type}s/{name}'
+
+    def image(self, name, size):
+
+        """
+        gets an image resized to size as a CTkImage, from memory if it was used before
+        :param size: (width, height)
+        :return: CTkImage
+        """
+
+        key = (name, tuple(size))
+        if key in self.images:
+            self.images.move_to_end(key)
+            return self.images[key]
+
+        img = CTkImage(self.load(name, key[1]), size=key[1])
+
+        # adding to the cache and dropping the least recently used image if it is full
+        self.images[key] = img
+        if len(self.images) > self.size:
+            self.images.popitem(last=False)
+
+        return img
+
+    def load(self, name, size):
+
+        # decodes the image already resized, using the copy on disk if it is newer than the asset
+
+        path = self.path('image', name)
+        cached = os.path.join(self.cache_dir, f'{name}_{size[0]}x{size[1]}.png')
+
+        if self.disk and os.path.exists(cached) and os.path.getmtime(cached) >= os.path.getmtime(path):
+            return Image.open(cached)
+
+        with Image.open(path) as full:
+            img = full.resize(size, Image.LANCZOS)
+
+        if self.disk:
+            # the disk cache is only an optimisation, so a read only assets folder is fine
+            try:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                img.save(cached)
+            except OSError:
+                pass
+
+        return img
+
+
+# registry used by the whole app
+registry = AssetRegistry()
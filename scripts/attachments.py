@@ -0,0 +1,120 @@
+import hashlib
+import multiprocessing
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+"""
+ Photo attachments of complaints
+ originals are kept in a content addressed store, every file is saved under the sha256 of its bytes
+ so the same photo attached twice is only stored once, and a small thumbnail is saved next to it
+
+ reading, hashing and thumbnailing a photo runs in a process pool, so a large photo is never decoded
+ on the Tk thread and decoding does not hold the window's GIL, the window only ever opens the thumbnails
+"""
+
+# folder of the store next to a building's databases
+ATTACHMENTS = 'attachments'
+ROOT = os.path.join('database', ATTACHMENTS)
+
+# largest size of a thumbnail
+THUMBNAIL = (96, 96)
+
+# file types the attach dialog shows
+TYPES = [('Images', '*.png *.jpg *.jpeg *.gif *.bmp *.webp'), ('All files', '*')]
+
+# bytes read at a time when hashing
+CHUNK = 1 << 20
+
+
+def original_path(root, digest):
+    # originals are spread over folders named by the first two characters of their hash
+    return os.path.join(root, 'objects', digest[:2], digest)
+
+
+def thumbnail_path(root, digest):
+    return os.path.join(root, 'thumbs', digest + '.png')
+
+
+def save_atomic(path, write):
+
+    # write(file) writes to a temporary file in the same folder which replaces path once it is complete,
+    # so a crash or two windows saving the same file never leave half a file behind
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            write(f)
+        os.replace(tmp, path)
+    except BaseException:
+        os.remove(tmp)
+        raise
+
+
+def ingest(path, root=ROOT, size=THUMBNAIL):
+
+    """
+    stores a photo and its thumbnail, runs in a worker process
+    the thumbnail is made first, so a file which is not an image raises before anything is stored
+    :return: (digest, name, type, bytes) of the attachment
+    """
+
+    # PIL is only imported in the worker processes, the window only opens thumbnails when it shows them
+    from PIL import Image
+
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while chunk := f.read(CHUNK):
+            sha.update(chunk)
+    digest = sha.hexdigest()
+
+    with Image.open(path) as im:
+        type = im.format
+        thumb = thumbnail_path(root, digest)
+        if not os.path.exists(thumb):
+            # draft lets jpeg decode straight at a fraction of the size instead of decoding every pixel
+            im.draft('RGB', size)
+            im.thumbnail(size)
+            small = im if im.mode in ('1', 'L', 'LA', 'P', 'RGB', 'RGBA') else im.convert('RGB')
+            save_atomic(thumb, lambda f: small.save(f, 'PNG'))
+
+    original = original_path(root, digest)
+    if not os.path.exists(original):
+        with open(path, 'rb') as src:
+            save_atomic(original, lambda f: shutil.copyfileobj(src, f, CHUNK))
+
+    return digest, os.path.basename(path), type, os.path.getsize(original)
+
+
+class AttachmentStore:
+
+    def __init__(self, root=ROOT, workers=2):
+
+        # the pool is started the first time a photo is attached
+        self.root = root
+        self.workers = workers
+        self.pool = None
+
+    def submit(self, path):
+
+        """
+        stores a photo in the background
+        :return: future of (digest, name, type, bytes)
+        """
+
+        if self.pool is None:
+            # spawned rather than forked, the window's process has Tk and the database worker's thread in it
+            self.pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+        return self.pool.submit(ingest, path, self.root)
+
+    def original(self, digest):
+        return original_path(self.root, digest)
+
+    def thumbnail(self, digest):
+        return thumbnail_path(self.root, digest)
+
+    def close(self):
+        if self.pool:
+            self.pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,330 @@
+import argparse
+import glob
+import os
+import shutil
+import sqlite3
+import tarfile
+import tempfile
+import time
+from datetime import datetime
+from threading import Event, Thread
+
+from scripts.attachments import ATTACHMENTS
+from scripts.connections import connect
+
+"""
+ Online backups, the databases are copied with sqlite's backup api while the app keeps running
+ a few pages are copied at a time with a short pause in between, so a backup never holds up the windows,
+ a write in the middle of a backup makes sqlite start again and after a few restarts the rest is copied in one go
+
+ a snapshot is one compressed tar of users.db and manager_dat.db (complaints are stored in manager_dat.db,
+ an old complaints.json which was never imported is included as well) and the photo attachments,
+ it is written under a temporary name and renamed once complete, and only the newest few are kept
+ a snapshot which is being made when the app closes is given up and its temporary file removed
+ every window and the server check whether a snapshot is due, holding a lock file in the snapshot folder
+ while they check and make it, so only one of them makes each snapshot
+
+ usage: python -m scripts.backup create
+        python -m scripts.backup list
+        python -m scripts.backup restore backups/pyapartments-20240101-120000.tar.gz
+"""
+
+DATABASES = ['users.db', 'manager_dat.db']
+FILES = ['complaints.json']
+
+PREFIX = 'pyapartments-'
+BACKUP_DIR = 'backups'
+LOCK = 'backup.lock'
+
+# pages copied per step, and seconds to wait between steps
+PAGES = 256
+PAUSE = 0.005
+
+# restarts allowed before the rest of a database is copied in one step
+RESTARTS = 3
+
+# snapshots kept, and seconds between snapshots made by BackupThread
+KEEP = 7
+INTERVAL = 24 * 3600
+
+# seconds after which a temporary or lock file is taken to be left over from a snapshot which never finished
+STALE = 3600
+
+
+class Restarted(Exception):
+    pass
+
+
+class Cancelled(Exception):
+    pass
+
+
+def cancelled(stop):
+    if stop is not None and stop.is_set(): raise Cancelled()
+
+
+class Stoppable:
+
+    # file which is read a chunk at a time by tarfile, so compressing a big database can be given up part way
+
+    def __init__(self, file, stop):
+        self.file = file
+        self.stop = stop
+
+    def read(self, size=-1):
+        cancelled(self.stop)
+        return self.file.read(size)
+
+
+def add(tar, path, arcname, stop=None):
+
+    # adds a file or folder to tar, checking stop between chunks and between the files of a folder
+
+    if os.path.isdir(path):
+        tar.add(path, arcname=arcname, filter=lambda info: cancelled(stop) or info)
+        return
+
+    with open(path, 'rb') as f:
+        tar.addfile(tar.gettarinfo(path, arcname), Stoppable(f, stop))
+
+
+def copy_database(src, dest, pages=PAGES, pause=PAUSE, stop=None):
+
+    """
+    copies the database at src to dest while others keep using it, giving up once stop (an Event) is set
+    :return: number of steps taken
+    """
+
+    steps = 0
+    restarts = 0
+    remaining = None
+
+    def progress(status, left, total):
+
+        # sqlite starts over when the database is written to by someone else during the backup
+        nonlocal steps, restarts, remaining
+        cancelled(stop)
+        steps += 1
+        if remaining is not None and left > remaining:
+            restarts += 1
+            if restarts > RESTARTS: raise Restarted()
+        remaining = left
+
+    source = connect(src)
+    target = sqlite3.connect(dest)
+    try:
+        try:
+            source.backup(target, pages=pages, progress=progress, sleep=pause)
+        except Restarted:
+            # in WAL mode copying everything in one step only holds a read lock, so writers are still not blocked
+            source.backup(target)
+            steps += 1
+    finally:
+        target.close()
+        source.close()
+
+    return steps
+
+
+def snapshots(out=BACKUP_DIR):
+    # snapshots, oldest first, the timestamp in the name sorts by time
+    return sorted(glob.glob(os.path.join(out, PREFIX + '*.tar.gz')))
+
+
+def create(db_dir='database', out=BACKUP_DIR, keep=KEEP, stop=None, databases=None):
+
+    """
+    makes a snapshot and removes all but the newest keep snapshots
+    raises Cancelled, leaving no temporary file behind, if stop (an Event) is set before it is done
+    :param databases: {name in DATABASES: path} for databases which are not in db_dir, e.g. the server's
+    :return: path of the snapshot
+    """
+
+    databases = {name: os.path.join(db_dir, name) for name in DATABASES} | (databases or {})
+
+    os.makedirs(out, exist_ok=True)
+    path = os.path.join(out, f'{PREFIX}{datetime.now():%Y%m%d-%H%M%S}.tar.gz')
+    part = f'{path}.{os.getpid()}.part'
+
+    try:
+        with tempfile.TemporaryDirectory() as tmp, tarfile.open(part, 'w:gz') as tar:
+            for name, src in databases.items():
+                if os.path.exists(src):
+                    copy_database(src, os.path.join(tmp, name), stop=stop)
+                    add(tar, os.path.join(tmp, name), name, stop)
+
+            for name in FILES:
+                if os.path.exists(os.path.join(db_dir, name)):
+                    tar.add(os.path.join(db_dir, name), arcname=name)
+
+            # photos are copied after the databases, so every photo a copied complaint refers to is already stored,
+            # stored photos are never changed so they can be copied as they are
+            if os.path.isdir(os.path.join(db_dir, ATTACHMENTS)):
+                add(tar, os.path.join(db_dir, ATTACHMENTS), ATTACHMENTS, stop)
+
+        os.replace(part, path)
+    except BaseException:
+        if os.path.exists(part): os.remove(part)
+        raise
+
+    for old in snapshots(out)[:-keep]:
+        os.remove(old)
+
+    return path
+
+
+def restore(snapshot, db_dir='database'):
+
+    """
+    puts the databases and photos of a snapshot back, copying into the databases with the backup api
+    so windows which have them open carry on with the restored data instead of a half written file
+    """
+
+    os.makedirs(db_dir, exist_ok=True)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        with tarfile.open(snapshot) as tar:
+            tar.extractall(tmp, filter='data')
+
+        for name in DATABASES:
+            if os.path.exists(os.path.join(tmp, name)):
+                source = sqlite3.connect(os.path.join(tmp, name))
+                target = connect(os.path.join(db_dir, name))
+                try:
+                    source.backup(target)
+                finally:
+                    target.close()
+                    source.close()
+
+        for name in FILES:
+            if os.path.exists(os.path.join(tmp, name)):
+                os.replace(os.path.join(tmp, name), os.path.join(db_dir, name))
+
+        if os.path.isdir(os.path.join(tmp, ATTACHMENTS)):
+            shutil.copytree(os.path.join(tmp, ATTACHMENTS), os.path.join(db_dir, ATTACHMENTS), dirs_exist_ok=True)
+
+
+def remove_stale(out=BACKUP_DIR, age=STALE):
+
+    # removing temporary files of snapshots which never finished, e.g. when the app was killed during one
+    # files younger than age may still be written by another window or the server, so they are left alone
+
+    for part in glob.glob(os.path.join(out, PREFIX + '*.part')):
+        try:
+            if time.time() - os.path.getmtime(part) > age:
+                os.remove(part)
+        except OSError:
+            # removed by someone else in the meantime
+            pass
+
+
+def lock(out=BACKUP_DIR):
+
+    """
+    takes the lock of the snapshot folder without waiting, the lock file is created only if it does not exist
+    so this works the same on every platform, a lock left by a process which was killed is taken over once stale
+    :return: whether the lock was taken, unlock(out) has to be called afterwards if it was
+    """
+
+    os.makedirs(out, exist_ok=True)
+    path = os.path.join(out, LOCK)
+
+    def create_lock():
+        try:
+            os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return True
+        except FileExistsError:
+            return False
+
+    if create_lock(): return True
+    try:
+        if time.time() - os.path.getmtime(path) <= STALE: return False
+        os.remove(path)
+    except FileNotFoundError:
+        # unlocked in the meantime
+        pass
+    return create_lock()
+
+
+def unlock(out=BACKUP_DIR):
+    os.remove(os.path.join(out, LOCK))
+
+
+def due(out=BACKUP_DIR, interval=INTERVAL):
+    # whether the newest snapshot is older than interval seconds
+    latest = snapshots(out)
+    return not latest or time.time() - os.path.getmtime(latest[-1]) > interval
+
+
+class BackupThread(Thread):
+
+    def __init__(self, db_dir='database', out=BACKUP_DIR, interval=INTERVAL, check=600, databases=None):
+
+        """
+        makes a snapshot whenever the newest one is more than interval seconds old, checking every check seconds
+        every window and the server can run one, the one holding the folder's lock (see lock()) makes the snapshot
+        and the others find it is no longer due
+        stop() has to be called when closing, so a snapshot being made is given up instead of left half written
+        databases are passed on to create()
+        """
+
+        super().__init__(daemon=True)
+        self.db_dir = db_dir
+        self.databases = databases
+        self.out = out
+        self.interval = interval
+        self.check = check
+        self.stopping = Event()
+        self.start()
+
+    def run(self):
+        remove_stale(self.out)
+        while not self.stopping.is_set():
+            try:
+                if lock(self.out):
+                    try:
+                        if due(self.out, self.interval):
+                            create(self.db_dir, self.out, stop=self.stopping, databases=self.databases)
+                    finally:
+                        unlock(self.out)
+            except Cancelled:
+                break
+            except (OSError, sqlite3.Error):
+                # trying again at the next check
+                pass
+            self.stopping.wait(self.check)
+
+    def stop(self):
+        # waits for the thread to finish, a snapshot being made is given up at its next step
+        self.stopping.set()
+        self.join()
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Back up and restore the databases while the app is running.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    create_parser = commands.add_parser('create', help='make a snapshot')
+    create_parser.add_argument('--keep', type=int, default=KEEP, help='snapshots to keep')
+    commands.add_parser('list', help='list snapshots, oldest first')
+    restore_parser = commands.add_parser('restore', help='restore a snapshot')
+    restore_parser.add_argument('snapshot')
+
+    for p in commands.choices.values():
+        p.add_argument('--db-dir', default='database', help='folder with the databases')
+        p.add_argument('--out', default=BACKUP_DIR, help='folder with the snapshots')
+    args = parser.parse_args()
+
+    if args.command == 'create':
+        print(create(args.db_dir, args.out, args.keep))
+    elif args.command == 'list':
+        for path in snapshots(args.out):
+            print(f'{path}  {os.path.getsize(path) / 1024:.0f} KB')
+    else:
+        restore(args.snapshot, args.db_dir)
+        print(f'restored {args.snapshot}')
+
+
+if __name__ == '__main__':
+    main()
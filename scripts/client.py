@@ -0,0 +1,121 @@
+import json
+from contextlib import nullcontext
+from http.client import HTTPConnection, HTTPException
+from urllib.parse import urlsplit, urlencode
+
+"""
+ Thin clients for server.py, they have the same methods as the repositories in scripts.database
+ so Home and Manager can use either, every call is one http request on a kept alive connection
+"""
+
+
+class RemoteError(Exception):
+
+    def __init__(self, status, message):
+        super().__init__(f'{status}: {message}')
+        self.status = status
+        self.message = message
+
+
+class RemoteRepository:
+
+    def __init__(self, url, timeout=10):
+
+        url = urlsplit(url)
+        self.host, self.port = url.hostname, url.port or 80
+        self.timeout = timeout
+        self.connection = None
+
+    def request(self, method, path, query=None, body=None):
+
+        """
+        sends a request and returns the decoded json response, rows come back as tuples
+        the connection is opened again once if the server closed it
+        """
+
+        if query:
+            path += '?' + urlencode({k: v for k, v in query.items() if v is not None})
+        data = json.dumps(body).encode() if body is not None else None
+
+        for retry in (True, False):
+            if self.connection is None:
+                self.connection = HTTPConnection(self.host, self.port, timeout=self.timeout)
+            try:
+                self.connection.request(method, path, data, {'Content-Type': 'application/json'} if data else {})
+                response = self.connection.getresponse()
+                result = json.loads(response.read())
+                break
+            except (HTTPException, OSError):
+                self.close()
+                if not retry: raise
+
+        if response.status != 200:
+            raise RemoteError(response.status, result.get('error'))
+
+        if isinstance(result, list):
+            return [tuple(row) if isinstance(row, list) else row for row in result]
+        return result
+
+    def batch(self):
+        # every request is its own transaction on the server
+        return nullcontext()
+
+    def close(self):
+        if self.connection:
+            self.connection.close()
+        self.connection = None
+
+
+class RemoteManagerRepository(RemoteRepository):
+
+    def history_page(self, room, before, limit):
+        return self.request('GET', '/history', {'room': room, 'before': json.dumps(before) if before else None,
+                                                'limit': limit})
+
+    def forum_page(self, before, limit):
+        return self.request('GET', '/forum', {'before': json.dumps(before) if before else None, 'limit': limit})
+
+    def data_version(self):
+        # number of writes the server has made, changes whenever something is written
+        return self.request('GET', '/version')
+
+    def full_days(self, service, start, end):
+        return self.request('GET', '/services/full', {'service': service, 'start': start, 'end': end})
+
+    def forum_last(self):
+        return self.request('GET', '/forum/last')
+
+    def forum_since(self, rowid, limit=100):
+        return self.request('GET', '/forum/since', {'rowid': rowid, 'limit': limit})
+
+    def search_forum(self, text, offset=0, limit=10):
+        return self.request('GET', '/search/forum', {'q': text, 'offset': offset, 'limit': limit})
+
+    def search_complaints(self, room, text, offset=0, limit=10):
+        return self.request('GET', '/search/complaints', {'room': room, 'q': text, 'offset': offset, 'limit': limit})
+
+    def add_message(self, room, content):
+        return tuple(self.request('POST', '/forum', body={'room': room, 'con': content}))
+
+    def add_service(self, room, service, sched, call):
+        return tuple(self.request('POST', '/services', body={'room': room, 'service': service, 'sched': sched,
+                                                             'call': call}))
+
+    def add_complaint(self, room, cat, sub, con, attachments=()):
+        # photos are stored next to the database, so they cannot be attached through the server
+        if attachments:
+            raise ValueError('photos can only be attached when the database is opened locally')
+        return tuple(self.request('POST', '/complaints', body={'room': room, 'cat': cat, 'sub': sub, 'con': con}))
+
+
+class RemoteUserRepository(RemoteRepository):
+
+    def exists(self, rno):
+        return self.request('GET', '/users', {'room': rno})['exists']
+
+    def check(self, rno, pwd):
+        return self.request('POST', '/login', body={'room': rno, 'password': pwd})['ok']
+
+    def add(self, rno, pwd, rct):
+        # the server checks the sign-up rules again, receipt included
+        self.request('POST', '/users', body={'room': rno, 'password': pwd, 'receipt': rct})
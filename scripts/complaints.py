@@ -0,0 +1,114 @@
+import json
+import os
+
+from scripts.connections import transaction
+
+"""
+ Complaint store, complaints are kept in an append-only sqlite table instead of a json file
+ every complaint gets its id from sqlite, so inserts cost the same however many complaints exist,
+ and two residents filing at once cannot overwrite each other or get the same id.
+ categories are kept in their own table so complaints can be looked up by category using an index
+"""
+
+# name of the old json file, next to the database it is imported into
+LEGACY_FILE = 'complaints.json'
+
+# categories a complaint can be filed under
+CATEGORIES = ['Service', 'Maintenance', 'Noise', 'Pest', 'Other']
+
+
+class ComplaintStore:
+
+    def __init__(self, dbcon, legacy=None):
+
+        # using the given connection, complaints live next to the requests they are recorded in
+        # the tables are created by the manager_dat.db migrations in scripts.database
+        # legacy is the path of an old complaints.json to import, nothing is imported if None
+        self.dbcon = dbcon
+
+        self.migrate(legacy)
+
+    def migrate(self, path):
+
+        """
+        one time import of the old complaints.json, all complaints are added in one transaction
+        and the file is renamed before it commits so it is never imported twice
+        :return: number of complaints imported
+        """
+
+        if path is None or not os.path.exists(path): return 0
+
+        # the file is read once the write lock is held, a window starting at the same time waits for the lock
+        # and then finds the file renamed, a missing file means someone else has imported it
+        renamed = False
+        try:
+            with transaction(self.dbcon):
+                try:
+                    with open(path) as c:
+                        complaints = json.load(c)
+                except FileNotFoundError:
+                    return 0
+
+                # keys are c0, c1, ... so they are sorted by their number to keep the filing order
+                for key in sorted(complaints, key=lambda k: int(k[1:])):
+                    c = complaints[key]
+                    self.insert(c['room'], c['cat'], c['sub'], c['con'], date=None)
+
+                os.replace(path, path + '.migrated')
+                renamed = True
+        except BaseException:
+            # nothing was imported, so the file is put back for the next window to import
+            if renamed: os.replace(path + '.migrated', path)
+            raise
+
+        return len(complaints)
+
+    def insert(self, room, cat, sub, con, date='now', attachments=()):
+
+        """
+        appends a complaint, does not commit so it can share a transaction with the requests row
+        :param attachments: (digest, name, type, bytes) of every photo, see scripts.attachments
+        :return: id of the new complaint
+        """
+
+        cid = self.dbcon.execute('INSERT INTO complaints(room, date, sub, con) VALUES (?, datetime(?), ?, ?)',
+                                 (room, date, sub, con)).lastrowid
+        self.dbcon.executemany('INSERT INTO complaint_cats VALUES (?, ?)', [(cid, c) for c in cat])
+
+        # a photo attached before is already known, only the link to this complaint is added
+        self.dbcon.executemany('INSERT OR IGNORE INTO attachments VALUES (?, ?, ?)',
+                               [(digest, type, size) for digest, name, type, size in attachments])
+        self.dbcon.executemany('INSERT INTO complaint_attachments VALUES (?, ?, ?)',
+                               [(cid, digest, name) for digest, name, type, size in attachments])
+        return cid
+
+    def add(self, room, cat, sub, con):
+
+        # registers a complaint and commits it
+        with transaction(self.dbcon):
+            return self.insert(room, cat, sub, con)
+
+    def get(self, cid):
+
+        # returns a complaint as a dictionary in the same form as the old json file
+        row = self.dbcon.execute('SELECT room, sub, con FROM complaints WHERE id = ?', (cid,)).fetchone()
+        if row is None: return None
+
+        return {'room': row[0], 'cat': self.categories(cid), 'sub': row[1], 'con': row[2],
+                'attachments': [digest for digest, *_ in self.attachments(cid)]}
+
+    def categories(self, cid):
+        return [c for c, in self.dbcon.execute('SELECT cat FROM complaint_cats WHERE cid = ?', (cid,))]
+
+    def attachments(self, cid):
+        # (digest, name, type, bytes) of the photos attached to a complaint
+        return self.dbcon.execute('SELECT a.digest, ca.name, a.type, a.bytes FROM complaint_attachments ca '
+                                  'JOIN attachments a ON a.digest = ca.digest WHERE ca.cid = ?', (cid,)).fetchall()
+
+    def by_room(self, room):
+        # ids of complaints registered by a room
+        return [i for i, in self.dbcon.execute('SELECT id FROM complaints WHERE room = ? ORDER BY id', (room,))]
+
+    def by_category(self, cat):
+        # ids of complaints with a category
+        return [i for i, in self.dbcon.execute('SELECT cid FROM complaint_cats WHERE cat = ? ORDER BY cid', (cat,))]
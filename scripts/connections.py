@@ -0,0 +1,228 @@
+import random
+import sqlite3
+import time
+from contextlib import contextmanager
+from threading import Lock
+
+from scripts import trace
+
+"""
+ Connection helpers shared by everything which opens a database
+ connections are opened in autocommit mode and transactions are started explicitly with transaction(),
+ so transactions can be nested (a nested one becomes a savepoint) and writes can be batched together
+
+ several windows (and the server) can use the same files at once:
+ databases are switched to WAL so readers never block the writer, sqlite waits up to BUSY_TIMEOUT for a lock,
+ write transactions take the write lock up front (BEGIN IMMEDIATE) and retry() runs them again with backoff
+ if the database stays locked, every process keeps one writer connection and opens readers as query only
+ time spent waiting for the write lock is recorded per database, see lock_report()
+ with tracing on (see scripts.trace) every statement's time and rows are recorded as well
+"""
+
+# size of sqlite's per connection statement cache
+STATEMENT_CACHE = 128
+
+# milliseconds sqlite keeps retrying a locked database before giving up
+BUSY_TIMEOUT = 5000
+
+# attempts and first delay in seconds of retry(), the delay doubles every attempt
+RETRIES = 5
+BACKOFF = 0.05
+
+# waiting longer than this for the write lock counts as contention
+WAIT_THRESHOLD = 0.001
+
+
+class LockStats:
+
+    def __init__(self):
+        self.lock = Lock()
+        self.transactions = 0
+        self.waits = 0
+        self.wait_time = 0.0
+        self.max_wait = 0.0
+        self.retries = 0
+        self.failures = 0
+
+    def record(self, **counts):
+        # adding to the counters, connections of several threads share the same stats
+        with self.lock:
+            for name, value in counts.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def record_begin(self, seconds):
+        with self.lock:
+            self.transactions += 1
+            if seconds > WAIT_THRESHOLD:
+                self.waits += 1
+                self.wait_time += seconds
+                self.max_wait = max(self.max_wait, seconds)
+
+    def as_dict(self):
+        return {'transactions': self.transactions, 'waits': self.waits,
+                'wait_ms': round(self.wait_time * 1000, 3), 'max_wait_ms': round(self.max_wait * 1000, 3),
+                'retries': self.retries, 'failures': self.failures}
+
+
+# stats of every database opened, by path
+stats = {}
+stats_lock = Lock()
+
+
+def lock_stats(path):
+    with stats_lock:
+        return stats.setdefault(path, LockStats())
+
+
+def lock_report():
+    # lock statistics of every database opened in this process
+    with stats_lock:
+        return {path: s.as_dict() for path, s in stats.items()}
+
+
+class Connection(sqlite3.Connection):
+
+    def __init__(self, path, *args, **kwargs):
+        super().__init__(path, *args, **kwargs)
+        self.path = path
+        self.stats = lock_stats(path)
+
+
+class TracedCursor(sqlite3.Cursor):
+
+    # cursor adding up the time spent running its statement and the rows fetched,
+    # the statement is recorded once the cursor is done with
+
+    def execute(self, sql, parameters=()):
+        return self.run(super().execute, sql, parameters)
+
+    def executemany(self, sql, parameters):
+        return self.run(super().executemany, sql, parameters)
+
+    def run(self, execute, sql, parameters):
+        self.sql, self.start, self.seconds, self.rows = sql, time.perf_counter(), 0.0, 0
+        execute(sql, parameters)
+        self.seconds = time.perf_counter() - self.start
+        return self
+
+    def timed(self, fetch, *args):
+        start = time.perf_counter()
+        try:
+            return fetch(*args)
+        finally:
+            self.seconds += time.perf_counter() - start
+
+    def fetchone(self):
+        row = self.timed(super().fetchone)
+        self.rows += row is not None
+        return row
+
+    def fetchmany(self, size=None):
+        rows = self.timed(super().fetchmany, size or self.arraysize)
+        self.rows += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = self.timed(super().fetchall)
+        self.rows += len(rows)
+        return rows
+
+    def __next__(self):
+        row = self.timed(super().__next__)
+        self.rows += 1
+        return row
+
+    def __del__(self):
+        if hasattr(self, 'sql'):
+            trace.record_statement(self.sql, self.start, self.seconds,
+                                   self.rows if self.description else max(self.rowcount, 0))
+
+
+class TracedConnection(Connection):
+
+    # connection running every statement on a TracedCursor, used when tracing is on
+
+    def execute(self, sql, parameters=()):
+        return self.cursor(TracedCursor).execute(sql, parameters)
+
+    def executemany(self, sql, parameters):
+        return self.cursor(TracedCursor).executemany(sql, parameters)
+
+    def commit(self):
+        with trace.span('COMMIT', 'sql'):
+            super().commit()
+
+
+def connect(path, **kwargs):
+
+    # opens a connection with a statement cache large enough for every query in the app, in WAL mode
+
+    dbcon = sqlite3.connect(path, timeout=BUSY_TIMEOUT / 1000, cached_statements=STATEMENT_CACHE,
+                            isolation_level=None, factory=TracedConnection if trace.ENABLED else Connection,
+                            **kwargs)
+    dbcon.execute('PRAGMA journal_mode = WAL')
+    return dbcon
+
+
+def read_only(dbcon):
+    # stops a connection from writing, used for the connections windows read with
+    dbcon.execute('PRAGMA query_only = 1')
+    return dbcon
+
+
+def is_locked(error):
+    return isinstance(error, sqlite3.OperationalError) and ('locked' in str(error) or 'busy' in str(error))
+
+
+@contextmanager
+def transaction(dbcon):
+
+    """
+    runs the block in a transaction, committing if it finishes and rolling back if it raises
+    inside another transaction a savepoint is used instead, so a failing block only undoes its own writes
+    """
+
+    if dbcon.in_transaction:
+        dbcon.execute('SAVEPOINT nested')
+        try:
+            yield dbcon
+        except BaseException:
+            dbcon.execute('ROLLBACK TO nested')
+            dbcon.execute('RELEASE nested')
+            raise
+        dbcon.execute('RELEASE nested')
+
+    else:
+        # taking the write lock straight away, sqlite waits for it up to the busy timeout
+        start = time.perf_counter()
+        dbcon.execute('BEGIN IMMEDIATE')
+        if isinstance(dbcon, Connection):
+            dbcon.stats.record_begin(time.perf_counter() - start)
+
+        try:
+            yield dbcon
+        except BaseException:
+            dbcon.rollback()
+            raise
+        dbcon.commit()
+
+
+def retry(fn, *args, stats=None):
+
+    """
+    calls fn(*args), calling it again with a growing delay while the database is locked
+    fn should run its writes in a transaction, so a failed attempt leaves nothing behind
+    """
+
+    for attempt in range(RETRIES):
+        try:
+            return fn(*args)
+        except sqlite3.OperationalError as e:
+            if not is_locked(e): raise
+
+            if attempt == RETRIES - 1:
+                if stats: stats.record(failures=1)
+                raise
+
+            if stats: stats.record(retries=1)
+            time.sleep(BACKOFF * 2 ** attempt * random.uniform(0.5, 1.5))
@@ -1,30 +1,39 @@
 from random import Random
+from time import perf_counter
 
 from CTkTable import CTkTable
-from PIL import Image
 from customtkinter import (
     CTkFrame,
     CTkLabel,
     CTkScrollableFrame,
+    CTkScrollbar,
     CTkTabview,
     CTkEntry,
     CTkTextbox,
     CTkCheckBox,
     CTkComboBox,
-    CTkImage
+    CTkButton,
+    CTkToplevel
 )
 
-from scripts.misc import getAsset
+from scripts.assets import registry
+from scripts.trace import timed
+from scripts.validation import Debounce
 
 """
  Custom widgets are defined to make it easier to create and use widgets in bulk
  CheckBoxGroup : used to make multiple checkboxes for options, it can return all boxes which are selected
- Entry : automatically labelling the entry and making easier to get and set values, and censoring
- BlockText : paragraph textbox for large amount of characters
+ Entry : automatically labelling the entry and making easier to get and set values, censoring and validation
+ BlockText : paragraph textbox for large amount of characters, with a character limit
+ SearchWindow : window with a search box and pages of results
  Message : simple chat message for forum page
+ ChatBox : scrolling chat that reuses a few Message widgets for the rows on screen
  Winframe : frame which makes it easier to add images, tables, widgets and other repetitive tasks easily and cleanly
  WinTable : custom table to make access easier
- WinTabView : creates a tab view with a winframe instead of a frame for tabs so that the application works smoothly
+ WinTabView : creates a tab view with a winframe instead of a frame for tabs so that the application works smoothly,
+              tabs can be given a builder so they are only built when first opened
+
+ with tracing on (see scripts.trace) the WinFrame helpers record how long every widget took to build
 """
 
 
@@ -76,11 +85,13 @@ class CheckBoxGroup(CTkFrame):
 
 class Entry(CTkFrame):
 
-    def __init__(self, root, name, censoring=False, width=150, **kwargs):
+    def __init__(self, root, name, censoring=False, width=150, field=None, report=None, **kwargs):
         # creating frame and adding title
 
         super().__init__(root, width=width, height=70, fg_color='transparent')
-        CTkLabel(self, text=f'{name}:', font=('Arial Bold', 15)).place(x=10, y=10)
+        self.title = CTkLabel(self, text=f'{name}:', font=('Arial Bold', 15))
+        self.title.place(x=10, y=10)
+        self.name = name
 
         # creating entry and checking for censoring
 
@@ -92,6 +103,35 @@ class Entry(CTkFrame):
 
         self.togglecensoring()
 
+        # with a field (see scripts.validation) every insert is checked as it is typed and refused if it doesn't fit,
+        # the whole value is checked once typing stops and an error turns the entry red and is passed to report
+        self.field = field
+        self.report = report
+        if field:
+            self.border = self.entry.cget('border_color')
+            self.entry.configure(validate='key', validatecommand=(self.register(self.on_key), '%d', '%S', '%P'))
+            self.recheck = Debounce(self, self.show_error)
+
+    def on_key(self, action, inserted, proposed):
+
+        # validatecommand of the entry, action is '1' for inserts, deletes are always allowed
+        if action == '1' and not self.field.accepts(inserted, len(proposed)):
+            self.bell()
+            return False
+
+        self.recheck()
+        return True
+
+    def show_error(self):
+
+        # checking the whole value, an empty entry is not an error until it is submitted
+        value = self.get()
+        error = self.field.check(value) if value else ''
+
+        self.entry.configure(border_color='#ff0000' if error else self.border)
+        if self.report:
+            self.report(f'{self.name}: {error}' if error else '')
+
     def togglecensoring(self):
         # turns on or off censoring
         self.entry.configure(show='' if self.censoring else '*')
@@ -112,24 +152,170 @@ class Message(CTkFrame):
         # creating frame
         super().__init__(master, width=width)
 
+        # creating user, content and date content is made to wrap around width, minimum width is 90px
+
+        self.user = CTkLabel(self, font=('Calibri Bold', 11), width=90, anchor='w')
+        self.user.pack(anchor='w', pady=1, padx=5)
+
+        self.content = CTkLabel(self, wraplength=width, font=('Arial Bold', 14), justify='left')
+        self.content.pack(anchor='w', after=self.user, padx=8, pady=5)
+
+        self.time = CTkLabel(self, font=('Calibri Bold', 8), anchor='w')
+        self.time.pack(anchor='e', pady=1, padx=5, after=self.content)
+        self.pack_propagate()
+
+        self.set(room, date, content)
+
+    def set(self, room, date, content):
+        # changes the message shown, so that the same widget can be reused for another row
+
         # creating a random color which remains same for same user, using random.Random seeds
         color_rand = Random(int(room[:3]))
 
-        # creating user, content and date content is made to wrap around width, minimum width is 90px
+        self.user.configure(text=f"Room {room}",
+                            text_color='#' + ''.join((hex(color_rand.randint(130, 255))[2:] for i in range(3))))
+        self.content.configure(text=content)
+        self.time.configure(
+            text=f"{'/'.join(date.split()[0].split('-')[:0:-1])}  " + ':'.join(date.split()[1].split(':')[:2]))
 
-        d = CTkLabel(self, text=f"Room {room}", font=('Calibri Bold', 11),
-                     text_color='#' + ''.join((hex(color_rand.randint(130, 255))[2:] for i in range(3))), width=90,
-                     anchor='w')
-        d.pack(anchor='w', pady=1, padx=5)
 
-        con = CTkLabel(self, wraplength=width, text=content, font=('Arial Bold', 14), justify='left')
-        con.pack(anchor='w', after=d, padx=8, pady=5)
+class ChatBox(CTkFrame):
 
-        t = CTkLabel(self,
-                     text=f"{'/'.join(date.split()[0].split('-')[:0:-1])}  " + ':'.join(date.split()[1].split(':')[:2]),
-                     font=('Calibri Bold', 8), anchor='w')
-        t.pack(anchor='e', pady=1, padx=5, after=con)
-        self.pack_propagate()
+    """
+    chat view which only renders the messages on screen, a small pool of Message widgets is reused
+    while scrolling and older messages are fetched a page at a time
+
+    fetch(before, limit) must return rows of (rowid, room, date, content), newest first,
+    older than the row before (or the newest rows if before is None)
+    """
+
+    def __init__(self, master, width, height, room, fetch, pool=6, page=50, **kwargs):
+
+        # creating frame, the body clips whatever does not fit so the pool never grows
+        super().__init__(master, width=width, height=height)
+
+        self.room = room
+        self.fetch = fetch
+        self.page = page
+
+        # loaded rows oldest first, end is the index after the last row on screen
+        self.rows = []
+        self.end = 0
+        self.exhausted = False
+
+        self.body = CTkFrame(self, fg_color='transparent')
+        self.body.place(x=0, y=0, relheight=1, width=width - 20)
+
+        self.scrollbar = CTkScrollbar(self, command=self.yview)
+        self.scrollbar.place(relx=1, y=0, relheight=1, anchor='ne')
+
+        # message widgets that are reused for the rows on screen
+        self.pool = [Message(self.body, width - 90, room, '2000-01-01 00:00:00', '') for _ in range(pool)]
+
+        # scrolling with the mouse wheel (windows/mac and linux)
+        self.wheel = [(seq, self.bind_all(seq, self.on_wheel, add='+'))
+                      for seq in ['<MouseWheel>', '<Button-4>', '<Button-5>']]
+
+        self.load_older()
+        self.scroll_to_bottom()
+
+        self.place(**kwargs)
+
+    def destroy(self):
+
+        # the wheel is bound on the whole window, so the chatbox's bindings are taken out of it
+        # leaving any other widget's bindings of the same sequences
+        for seq, funcid in self.wheel:
+            script = self.tk.call('bind', 'all', seq)
+            self.tk.call('bind', 'all', seq, '\n'.join(line for line in script.split('\n') if funcid not in line))
+            self.deletecommand(funcid)
+        super().destroy()
+
+    def load_older(self):
+
+        # fetching the page before the oldest loaded row and putting it in front
+
+        if self.exhausted: return 0
+        page = self.fetch(self.rows[0] if self.rows else None, self.page)
+        if len(page) < self.page:
+            self.exhausted = True
+
+        self.rows[:0] = page[::-1]
+        self.end += len(page)
+        return len(page)
+
+    def render(self):
+
+        # filling the pool with the rows ending at self.end, newest message is at the bottom
+
+        for msg in self.pool:
+            msg.pack_forget()
+
+        shown = self.rows[max(0, self.end - len(self.pool)):self.end][::-1]
+        for msg, (_, room, date, content) in zip(self.pool, shown):
+            msg.set(room, date, content)
+            msg.pack(side='bottom', anchor='e' if room == self.room else 'w', pady=10)
+
+        # scrollbar is relative to the rows loaded so far
+        total = max(len(self.rows), 1)
+        self.scrollbar.set(max(0, self.end - len(self.pool)) / total, self.end / total)
+
+    def scroll(self, n):
+
+        # moves the view by n messages, loading older pages when nearing the top
+
+        self.end = min(len(self.rows), max(min(len(self.pool), len(self.rows)), self.end + n))
+        if self.end - len(self.pool) < len(self.pool):
+            self.load_older()
+        self.render()
+
+    def scroll_to_bottom(self):
+        self.end = len(self.rows)
+        self.render()
+
+    def yview(self, action, *args):
+
+        # scrollbar command, either ('moveto', fraction) or ('scroll', n, 'units')
+
+        if action == 'moveto':
+            self.scroll(round(float(args[0]) * len(self.rows)) + len(self.pool) - self.end)
+        else:
+            self.scroll(int(args[0]))
+
+    def on_wheel(self, event):
+
+        # only scroll when the cursor is over the chatbox
+
+        if not str(event.widget).startswith(str(self)): return
+        self.scroll(-1 if event.num == 4 or event.delta > 0 else 1)
+
+    def append(self, row):
+
+        # adding a new row at the bottom, following it if the view was at the bottom
+
+        following = self.end == len(self.rows)
+        self.rows.append(row)
+        if following:
+            self.end = len(self.rows)
+        self.render()
+
+    def replace_row(self, old, new=None):
+
+        # swapping a row for another (or removing it if new is None), used once a message sent optimistically is saved
+
+        for i in range(len(self.rows) - 1, -1, -1):
+            if self.rows[i] is old:
+                break
+        else:
+            return
+
+        if new is None:
+            del self.rows[i]
+            if self.end > i:
+                self.end -= 1
+        else:
+            self.rows[i] = new
+        self.render()
 
 
 class BlockText(CTkFrame):
@@ -146,24 +332,71 @@ class BlockText(CTkFrame):
         self.text = CTkTextbox(self, width=width - 20, height=height - 50)
         self.text.place(x=10, y=40)
 
-        self.old_value = ''
-
-        # binding keypress to the char limit checking function
-        self.text.bind('<KeyPress>', self.check_limit)
+        # with a limit, the characters in the textbox are counted as they are inserted and deleted
+        # and inserts are cut to fit, so the text is never read or put back while typing
+        if m:
+            self.length = 0
+            self.counter = CTkLabel(self, text=f'0/{m}', font=('Arial', 10))
+            self.counter.place(x=width - 10, y=12, anchor='ne')
+            self.update_counter = Debounce(self, self.show_count, delay=100)
+            self.redirect(self.text._textbox)
 
         self.place(**kwargs)
 
-    def check_limit(self, event):
+    def redirect(self, widget):
 
-        # if limit exists. checks character limit, and if exceeded, reverts to prvs value
+        # putting dispatch in front of the text widget's tcl command, like idlelib's WidgetRedirector,
+        # so every insert and delete goes through it whether it comes from typing, pasting or code
 
-        if not self.limit: return
-        t = self.get()
-        if len(t) > self.limit:
-            self.clear()
-            self.text.insert(0.0, self.old_value)
-        else:
-            self.old_value = t.strip()
+        self.original = widget._w + '_original'
+        widget.tk.call('rename', widget._w, self.original)
+        widget.tk.createcommand(widget._w, self.dispatch)
+
+        # deleting the command with the widget
+        widget._tclCommands = (widget._tclCommands or []) + [widget._w]
+
+    def dispatch(self, command, *args):
+
+        # runs a command of the text widget, keeping count of the characters in it
+
+        if command == 'insert':
+            # args are index, text, tags, text, tags ...
+            args = list(args)
+            for i in range(1, len(args), 2):
+                fits = args[i][:max(0, self.limit - self.length)]
+                if len(fits) < len(args[i]): self.bell()
+                args[i] = fits
+                self.length += len(fits)
+            self.update_counter()
+
+        elif command == 'delete':
+            for i in range(0, len(args), 2):
+                self.length -= self.span(*args[i:i + 2])
+            self.update_counter()
+
+        elif command == 'replace':
+            self.dispatch('delete', *args[:2])
+            return self.dispatch('insert', args[0], *args[2:])
+
+        result = self.tk.call(self.original, command, *args)
+
+        if command == 'edit' and args and args[0] in ('undo', 'redo'):
+            # undo can insert and delete anything, so the text is counted again
+            self.length = self.span('1.0', 'end')
+            self.update_counter()
+
+        return result
+
+    def span(self, first, last=None):
+
+        # number of characters a delete from first to last removes, the newline at the end is never deleted
+        last = last or f'{first}+1c'
+        if self.tk.getboolean(self.tk.call(self.original, 'compare', last, '>', 'end-1c')):
+            last = 'end-1c'
+        return max(0, int(self.tk.call(self.original, 'count', '-chars', first, last) or 0))
+
+    def show_count(self):
+        self.counter.configure(text=f'{self.length}/{self.limit}')
 
     def get(self):
 
@@ -176,18 +409,96 @@ class BlockText(CTkFrame):
         self.text.delete('0.0', 'end')
 
 
+class SearchWindow(CTkToplevel):
+
+    """
+    window with a search box and a page of results
+    search(text, offset, limit) must return the results as a list of strings, best matches first
+    """
+
+    def __init__(self, title, search, page=6):
+
+        # creating window with basic information
+        super().__init__()
+        self.geometry('420x520+250+150')
+        self.title(title)
+        self.resizable(False, False)
+
+        self.search = search
+        self.page = page
+        self.text = ''
+        self.offset = 0
+        self.more = False
+
+        # search box, enter also searches
+        self.entry = CTkEntry(self, width=300, placeholder_text='Search...')
+        self.entry.place(x=10, y=10)
+        self.entry.bind('<Return>', lambda e: self.find())
+        CTkButton(self, text='Search', width=90, command=self.find).place(x=320, y=10)
+
+        # labels reused for every page of results
+        self.results = []
+        for i in range(page):
+            label = CTkLabel(self, text='', wraplength=390, justify='left', anchor='w', font=('Arial', 13))
+            label.place(x=15, y=55 + i * 70)
+            self.results.append(label)
+
+        # moving between pages, status shows the page and how long the search took
+        CTkButton(self, text='<', width=30, command=self.prev_page).place(x=10, y=480)
+        self.status = CTkLabel(self, text='', width=320)
+        self.status.place(x=50, y=480)
+        CTkButton(self, text='>', width=30, command=self.next_page).place(x=380, y=480)
+
+        self.entry.focus()
+
+    def find(self):
+        # starts a new search from the first page
+        self.text = self.entry.get().strip()
+        self.offset = 0
+        self.load()
+
+    def load(self):
+
+        # fetching the current page, one extra result is fetched to know if there is a next page
+
+        start = perf_counter()
+        found = self.search(self.text, self.offset, self.page + 1)
+        taken = (perf_counter() - start) * 1000
+
+        self.more = len(found) > self.page
+        for i, label in enumerate(self.results):
+            label.configure(text=found[i] if i < len(found) else '')
+
+        if found:
+            self.status.configure(text=f'Page {self.offset // self.page + 1}  ({taken:.0f} ms)')
+        else:
+            self.status.configure(text='No results' if self.text else '')
+
+    def next_page(self):
+        if not self.more: return
+        self.offset += self.page
+        self.load()
+
+    def prev_page(self):
+        if not self.offset: return
+        self.offset -= self.page
+        self.load()
+
+
 class WinFrame(CTkFrame):
 
     def __init__(self, *args, **kwargs):
         # creating simple frame
         super().__init__(*args, **kwargs)
 
+    @timed('widget')
     def addframe(self, width=200, height=200, **kwargs):
         # adds another frame inside current frame
         frame = WinFrame(self, width, height)
         frame.place(**kwargs)
         return frame
 
+    @timed('widget')
     def createchoice(self, name, options, **kwargs):
         # creates a combobox with a title to choose from values and returns the combo box
         frame = CTkFrame(self, width=200, height=90)
@@ -198,8 +509,11 @@ class WinFrame(CTkFrame):
         frame.place(**kwargs)
         return combo
 
-    def createtable(self, title, columns, width, height, values, **kwargs):
+    @timed('widget')
+    def createtable(self, title, columns, width, height, values=None, fetch=None, page=10, command=None, **kwargs):
         # creates a table with a title, and titled columns and returns it
+        # if fetch is given the table is paged, rows are fetched a page at a time instead of passing all values
+        # command(cell) is called when a cell is clicked, with the cell's row and column
 
         # creating a scrollable frame so that multiple valyues can be inserted
         frame = CTkScrollableFrame(self, width, height)
@@ -207,31 +521,107 @@ class WinFrame(CTkFrame):
 
         label = CTkLabel(frame, text=title, font=('Calibri Bold', 24))
         label.pack(padx=10, pady=10, )
-        table = CTkTable(frame,
-                         column=len(columns),
-                         row=len(values) + 1,
-                         values=[[i.title() for i in list(columns)]] + values,
-                         width=(width - 20 - len(columns) * 1) / len(columns))
+        table = WinTable(frame, columns, width, values=values, fetch=fetch, page=page, command=command)
         table.pack()
+
+        if fetch:
+            # buttons to move between pages, the label shows the current page number
+            nav = CTkFrame(frame, fg_color='transparent')
+            CTkButton(nav, text='<', width=30, command=table.prev_page).pack(side='left', padx=5)
+            table.page_label = CTkLabel(nav, text='Page 1', width=80)
+            table.page_label.pack(side='left')
+            CTkButton(nav, text='>', width=30, command=table.next_page).pack(side='left', padx=5)
+            nav.pack(pady=5)
+
         return table
 
+    @timed('widget')
     def addimage(self, name, width, height, **kwargs):
-        # adds an image by taking its filename
+        # adds an image by taking its filename, decoded images are cached by the asset registry
 
-        img = CTkImage(Image.open(getAsset('image', name)), size=(width, height))
-        imagelabel = CTkLabel(self, image=img, text='')
+        imagelabel = CTkLabel(self, image=registry.image(name, (width, height)), text='')
         imagelabel.place(**kwargs)
 
         return imagelabel
 
 
+class WinTable(CTkTable):
+
+    """
+    table with a header row, either holding all values or paged
+
+    in paged mode fetch(before, limit) must return rows of (key, *values), newest first, older than the row
+    before (or the newest rows if before is None), the table only ever has page rows of cells which are reused
+    """
+
+    def __init__(self, master, columns, width, values=None, fetch=None, page=10, command=None):
+
+        self.header = [i.title() for i in list(columns)]
+        self.fetch = fetch
+        self.page = page
+
+        # rows on the current page, and the row each visited page was fetched before (first page is None)
+        self.shown = []
+        self.starts = [None]
+        self.more = False
+        self.page_label = None
+
+        if fetch:
+            values = [[''] * len(self.header) for _ in range(page)]
+
+        super().__init__(master,
+                         column=len(self.header),
+                         row=len(values) + 1,
+                         values=[self.header] + values,
+                         width=(width - 20 - len(self.header) * 1) / len(self.header),
+                         # given to the constructor, CTkTable binds the cells to it when drawing them
+                         command=command)
+
+        if fetch:
+            self.load()
+
+    def load(self):
+
+        # fetching the current page, one extra row is fetched to know if there is a next page
+
+        rows = self.fetch(self.starts[-1], self.page + 1)
+        self.more = len(rows) > self.page
+        self.show(rows[:self.page])
+
+    def show(self, rows):
+
+        # writing rows into the existing cells, so no widgets are created while paging
+
+        self.shown = list(rows)
+        for i in range(self.page):
+            values = self.shown[i][1:] if i < len(self.shown) else [''] * len(self.header)
+            for j, value in enumerate(values):
+                self.frame[i + 1, j].configure(require_redraw=True, text=value)
+        self.update_data()
+
+        if self.page_label:
+            self.page_label.configure(text=f'Page {len(self.starts)}')
+
+    def next_page(self):
+        if not (self.fetch and self.more): return
+        self.starts.append(self.shown[-1])
+        self.load()
+
+    def prev_page(self):
+        if not (self.fetch and len(self.starts) > 1): return
+        self.starts.pop()
+        self.load()
+
+
 class WinTabView(CTkTabview):
 
-    def __init__(self, *args, **kwargs):
-        # creates simple tab view
-        super().__init__(*args, **kwargs)
+    def __init__(self, *args, command=None, **kwargs):
+        # creates simple tab view, tabs with a builder are built the first time they are selected
+        self.builders = {}
+        self.on_select = command
+        super().__init__(*args, command=self.select_tab, **kwargs)
 
-    def add_tab(self, name):
+    def add_tab(self, name, builder=None):
         # setting tab as winframe
         self.add(name)
 
@@ -241,8 +631,21 @@ class WinTabView(CTkTabview):
                                         border_width=0,
                                         corner_radius=0)
 
+        # builder(tab) fills the tab when it is first shown
+        if builder:
+            self.builders[name] = builder
+
         return self._tab_dict[name]
 
+    def build(self, name):
+        # builds the tab if it has not been built yet
+        if name in self.builders:
+            self.builders.pop(name)(self._tab_dict[name])
+
+    def select_tab(self):
+        self.build(self.get())
+        if self.on_select: self.on_select()
+
     def tab(self, name: str) -> WinFrame:
         """ returns reference to the tab with given name """
 
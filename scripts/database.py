@@ -0,0 +1,509 @@
+import os
+from datetime import date
+
+from scripts.complaints import ComplaintStore, LEGACY_FILE
+from scripts.connections import connect, read_only, transaction
+from scripts.scheduling import FullyBooked, capacity
+
+"""
+ Data access layer, all sql used by the app lives here so the windows never touch a cursor
+ ManagerRepository : requests, services, forum and complaints in manager_dat.db
+ UserRepository : room numbers and passwords in users.db
+
+ every statement is a constant with ? parameters, so sqlite's statement cache reuses the compiled query
+ schemas are versioned with PRAGMA user_version, a migration is a list of statements which runs once
+"""
+
+# largest rowid, used when paging from the newest row
+MAX_ROWID = 2 ** 63 - 1
+
+MANAGER_MIGRATIONS = [
+    # 1 : original tables, complaints table from the complaint store
+    [
+        'CREATE TABLE IF NOT EXISTS requests(type varchar(20), room char(4), date datetime, req varchar(20))',
+        'CREATE TABLE IF NOT EXISTS services(service varchar(20), room char(4), date datetime, sched datetime, '
+        'call bool)',
+        'CREATE TABLE IF NOT EXISTS forum(room char(4), date datetime, con varchar(200))',
+        'CREATE TABLE IF NOT EXISTS complaints(id INTEGER PRIMARY KEY AUTOINCREMENT, room char(4), date datetime, '
+        'sub varchar(100), con text)',
+        'CREATE TABLE IF NOT EXISTS complaint_cats(cid integer REFERENCES complaints(id), cat varchar(20))',
+        'CREATE INDEX IF NOT EXISTS complaints_room ON complaints(room)',
+        'CREATE INDEX IF NOT EXISTS complaint_cats_cat ON complaint_cats(cat, cid)',
+    ],
+    # 2 : indexes for room history and date ranges
+    [
+        'CREATE INDEX IF NOT EXISTS requests_room_date ON requests(room, date)',
+        'CREATE INDEX IF NOT EXISTS services_room_date ON services(room, date)',
+        'CREATE INDEX IF NOT EXISTS forum_date ON forum(date)',
+    ],
+    # 3 : full text indexes on forum messages and complaints, kept up to date by triggers
+    [
+        "CREATE VIRTUAL TABLE forum_fts USING fts5(con, content='forum', content_rowid='rowid')",
+        'CREATE TRIGGER forum_fts_insert AFTER INSERT ON forum BEGIN '
+        'INSERT INTO forum_fts(rowid, con) VALUES (new.rowid, new.con); END',
+        'CREATE TRIGGER forum_fts_delete AFTER DELETE ON forum BEGIN '
+        "INSERT INTO forum_fts(forum_fts, rowid, con) VALUES ('delete', old.rowid, old.con); END",
+        'CREATE TRIGGER forum_fts_update AFTER UPDATE OF con ON forum BEGIN '
+        "INSERT INTO forum_fts(forum_fts, rowid, con) VALUES ('delete', old.rowid, old.con); "
+        'INSERT INTO forum_fts(rowid, con) VALUES (new.rowid, new.con); END',
+        "INSERT INTO forum_fts(forum_fts) VALUES ('rebuild')",
+
+        "CREATE VIRTUAL TABLE complaints_fts USING fts5(sub, con, content='complaints', content_rowid='id')",
+        'CREATE TRIGGER complaints_fts_insert AFTER INSERT ON complaints BEGIN '
+        'INSERT INTO complaints_fts(rowid, sub, con) VALUES (new.id, new.sub, new.con); END',
+        'CREATE TRIGGER complaints_fts_delete AFTER DELETE ON complaints BEGIN '
+        "INSERT INTO complaints_fts(complaints_fts, rowid, sub, con) VALUES ('delete', old.id, old.sub, old.con); END",
+        'CREATE TRIGGER complaints_fts_update AFTER UPDATE OF sub, con ON complaints BEGIN '
+        "INSERT INTO complaints_fts(complaints_fts, rowid, sub, con) VALUES ('delete', old.id, old.sub, old.con); "
+        'INSERT INTO complaints_fts(rowid, sub, con) VALUES (new.id, new.sub, new.con); END',
+        "INSERT INTO complaints_fts(complaints_fts) VALUES ('rebuild')",
+    ],
+    # 4 : bookings of each service per day, kept up to date by triggers
+    [
+        'CREATE TABLE service_load(service varchar(20), day text, booked integer, PRIMARY KEY (service, day)) '
+        'WITHOUT ROWID',
+        'INSERT INTO service_load SELECT service, sched, count(*) FROM services GROUP BY service, sched',
+        'CREATE TRIGGER service_load_insert AFTER INSERT ON services BEGIN '
+        'INSERT INTO service_load VALUES (new.service, new.sched, 1) '
+        'ON CONFLICT (service, day) DO UPDATE SET booked = booked + 1; END',
+        'CREATE TRIGGER service_load_delete AFTER DELETE ON services BEGIN '
+        'UPDATE service_load SET booked = booked - 1 WHERE service = old.service AND day = old.sched; END',
+    ],
+    # 5 : request counts by type, room and month and complaint counts by category, kept up to date by triggers
+    [
+        'CREATE TABLE request_counts(type varchar(20), room char(4), month text, n integer, '
+        'PRIMARY KEY (type, room, month)) WITHOUT ROWID',
+        'INSERT INTO request_counts SELECT type, room, substr(date, 1, 7), count(*) FROM requests '
+        'GROUP BY type, room, substr(date, 1, 7)',
+        'CREATE TRIGGER request_counts_insert AFTER INSERT ON requests BEGIN '
+        'INSERT INTO request_counts VALUES (new.type, new.room, substr(new.date, 1, 7), 1) '
+        'ON CONFLICT (type, room, month) DO UPDATE SET n = n + 1; END',
+        'CREATE TRIGGER request_counts_delete AFTER DELETE ON requests BEGIN '
+        'UPDATE request_counts SET n = n - 1 '
+        'WHERE type = old.type AND room = old.room AND month = substr(old.date, 1, 7); END',
+
+        'CREATE TABLE complaint_counts(cat varchar(20) PRIMARY KEY, n integer) WITHOUT ROWID',
+        'INSERT INTO complaint_counts SELECT cat, count(*) FROM complaint_cats GROUP BY cat',
+        'CREATE TRIGGER complaint_counts_insert AFTER INSERT ON complaint_cats BEGIN '
+        'INSERT INTO complaint_counts VALUES (new.cat, 1) ON CONFLICT (cat) DO UPDATE SET n = n + 1; END',
+        'CREATE TRIGGER complaint_counts_delete AFTER DELETE ON complaint_cats BEGIN '
+        'UPDATE complaint_counts SET n = n - 1 WHERE cat = old.cat; END',
+    ],
+    # 6 : cold table for forum messages older than the retention window, with its own full text index
+    # messages keep their rowid as id so paging and search work the same on both tables
+    [
+        'CREATE TABLE forum_archive(id INTEGER PRIMARY KEY, room char(4), date datetime, con varchar(200))',
+        'CREATE INDEX forum_archive_date ON forum_archive(date)',
+        "CREATE VIRTUAL TABLE forum_archive_fts USING fts5(con, content='forum_archive', content_rowid='id')",
+        'CREATE TRIGGER forum_archive_fts_insert AFTER INSERT ON forum_archive BEGIN '
+        'INSERT INTO forum_archive_fts(rowid, con) VALUES (new.id, new.con); END',
+        'CREATE TRIGGER forum_archive_fts_delete AFTER DELETE ON forum_archive BEGIN '
+        "INSERT INTO forum_archive_fts(forum_archive_fts, rowid, con) VALUES ('delete', old.id, old.con); END",
+    ],
+    # 7 : photos attached to complaints, the files are in the attachment store named by their sha256
+    [
+        'CREATE TABLE attachments(digest char(64) PRIMARY KEY, type varchar(10), bytes integer) WITHOUT ROWID',
+        'CREATE TABLE complaint_attachments(cid integer REFERENCES complaints(id), '
+        'digest char(64) REFERENCES attachments(digest), name text)',
+        'CREATE INDEX complaint_attachments_cid ON complaint_attachments(cid)',
+    ],
+    # 8 : status, priority and assignee of complaints and services for the triage dashboard
+    # the indexes start with status so a queue never reads the resolved history, then follow the queue's order
+    # services scheduled before today were carried out already and start off resolved
+    [
+        "ALTER TABLE complaints ADD COLUMN status varchar(12) NOT NULL DEFAULT 'open'",
+        'ALTER TABLE complaints ADD COLUMN priority integer NOT NULL DEFAULT 3',
+        'ALTER TABLE complaints ADD COLUMN assignee varchar(20)',
+        "ALTER TABLE services ADD COLUMN status varchar(12) NOT NULL DEFAULT 'open'",
+        'ALTER TABLE services ADD COLUMN priority integer NOT NULL DEFAULT 3',
+        'ALTER TABLE services ADD COLUMN assignee varchar(20)',
+        "UPDATE services SET status = 'resolved' WHERE sched < date()",
+        'CREATE INDEX complaints_triage ON complaints(status, priority, id)',
+        # categories of each complaint on the dashboard
+        'CREATE INDEX complaint_cats_cid ON complaint_cats(cid)',
+        'CREATE INDEX services_triage ON services(status, priority, sched)',
+        'CREATE INDEX services_triage_service ON services(status, service, priority, sched)',
+    ],
+]
+
+# months of forum messages kept in the forum table, older months are moved to forum_archive
+FORUM_RETENTION = 12
+
+# messages moved to the archive per transaction
+ARCHIVE_BATCH = 500
+
+# columns request counts can be grouped by
+REQUEST_GROUPS = ('type', 'room', 'month')
+
+# states of a complaint or service on the triage dashboard, and priorities from most to least urgent
+STATUSES = ('open', 'in progress', 'resolved')
+PRIORITIES = {1: 'Urgent', 2: 'High', 3: 'Normal', 4: 'Low'}
+
+# tables with a triage queue, and the filter each can be narrowed down by
+QUEUES = {'complaints': 'cat', 'services': 'service'}
+
+# every row of a table, for exports
+EXPORTS = {
+    'requests': 'SELECT rowid, type, room, date, req FROM requests ORDER BY rowid',
+    'services': 'SELECT rowid, service, room, date, sched, call, status, priority, assignee FROM services '
+                'ORDER BY rowid',
+    'forum': 'SELECT id, room, date, con FROM forum_archive UNION ALL '
+             'SELECT rowid, room, date, con FROM forum ORDER BY 1',
+    'complaints': "SELECT c.id, c.room, c.date, (SELECT group_concat(cat, ', ') FROM complaint_cats WHERE cid = c.id) "
+                  'AS cat, c.sub, c.con, c.status, c.priority, c.assignee FROM complaints c ORDER BY c.id',
+}
+
+USER_MIGRATIONS = [
+    # 1 : original table
+    [
+        'CREATE TABLE IF NOT EXISTS users(rno char(4) PRIMARY KEY, pwd varchar(24))',
+    ],
+]
+
+
+def migrate(dbcon, migrations):
+
+    """
+    runs every migration newer than the database's user_version, each in its own transaction
+    the version is read again once the write lock is held, so when several processes open a new database
+    at the same time each migration only runs in the first one to get the lock
+    :return: version of the database after migrating
+    """
+
+    version, = dbcon.execute('PRAGMA user_version').fetchone()
+
+    while version < len(migrations):
+        with transaction(dbcon):
+            version, = dbcon.execute('PRAGMA user_version').fetchone()
+            if version == len(migrations): break
+
+            for statement in migrations[version]:
+                dbcon.execute(statement)
+            version += 1
+            dbcon.execute(f'PRAGMA user_version = {version}')
+
+    return len(migrations)
+
+
+def match_query(text):
+
+    # turns what the user typed into an fts5 query, every word is quoted and the last one matches as a prefix
+    words = ['"' + w.replace('"', '""') + '"' for w in text.split()]
+    if not words: return None
+    return ' '.join(words) + '*'
+
+
+def retention_cutoff(months=FORUM_RETENTION, today=None):
+    # first day of the oldest month kept, messages before it are archived a whole month at a time
+    today = today or date.today()
+    months = today.year * 12 + today.month - 1 - months
+    return str(date(months // 12, months % 12 + 1, 1))
+
+
+class ManagerRepository:
+
+    HISTORY_PAGE = ('SELECT rowid, date, type, req FROM requests WHERE room = ? AND (date, rowid) < (?, ?) '
+                    'ORDER BY date DESC, rowid DESC LIMIT ?')
+    GET_REQUEST = 'SELECT rowid, date, type, req FROM requests WHERE rowid = ?'
+    FORUM_PAGE = ('SELECT rowid, room, date, con FROM forum WHERE (date, rowid) < (?, ?) '
+                  'ORDER BY date DESC, rowid DESC LIMIT ?')
+    ARCHIVE_PAGE = ('SELECT id, room, date, con FROM forum_archive WHERE (date, id) < (?, ?) '
+                    'ORDER BY date DESC, id DESC LIMIT ?')
+    ADD_REQUEST = 'INSERT INTO requests VALUES (?, ?, date(), ?)'
+    ADD_SERVICE = 'INSERT INTO services(service, room, date, sched, call) VALUES (?, ?, date(), ?, ?)'
+    ADD_MESSAGE = 'INSERT INTO forum VALUES (?, datetime(), ?)'
+    GET_MESSAGE = 'SELECT rowid, room, date, con FROM forum WHERE rowid = ?'
+    FORUM_SINCE = 'SELECT rowid, room, date, con FROM forum WHERE rowid > ? ORDER BY rowid LIMIT ?'
+    FORUM_LAST = 'SELECT max(rowid) FROM forum'
+    SERVICE_LOAD = 'SELECT booked FROM service_load WHERE service = ? AND day = ?'
+    FULL_DAYS = 'SELECT day FROM service_load WHERE service = ? AND day >= ? AND day < ? AND booked >= ?'
+    SEARCH_FORUM = ("SELECT f.rowid, f.room, f.date, snippet(forum_fts, 0, '[', ']', '...', 12), forum_fts.rank AS r "
+                    'FROM forum_fts JOIN forum f ON f.rowid = forum_fts.rowid WHERE forum_fts MATCH ? UNION ALL '
+                    "SELECT a.id, a.room, a.date, snippet(forum_archive_fts, 0, '[', ']', '...', 12), "
+                    'forum_archive_fts.rank FROM forum_archive_fts '
+                    'JOIN forum_archive a ON a.id = forum_archive_fts.rowid '
+                    'WHERE forum_archive_fts MATCH ? ORDER BY r LIMIT ? OFFSET ?')
+    # the newest message is never archived, so rowids of new messages never come back to ones in the archive
+    ARCHIVE_FORUM = ('INSERT INTO forum_archive SELECT rowid, room, date, con FROM forum '
+                     'WHERE date < ? AND rowid < (SELECT max(rowid) FROM forum) ORDER BY date, rowid LIMIT ?')
+    DELETE_ARCHIVED = ('DELETE FROM forum WHERE rowid IN (SELECT rowid FROM forum '
+                       'WHERE date < ? AND rowid < (SELECT max(rowid) FROM forum) ORDER BY date, rowid LIMIT ?)')
+    SEARCH_COMPLAINTS = ("SELECT c.id, c.date, c.sub, snippet(complaints_fts, 1, '[', ']', '...', 12) "
+                         'FROM complaints_fts JOIN complaints c ON c.id = complaints_fts.rowid '
+                         'WHERE complaints_fts MATCH ? AND c.room = ? ORDER BY rank LIMIT ? OFFSET ?')
+
+    # triage queues, a page is the rows after the last row of the previous page in (priority, ...) order
+    # the filters are added to the WHERE clause when they are used, see queue()
+    COMPLAINT_QUEUE = ("SELECT c.id, c.priority, c.date, c.room, c.sub, (SELECT group_concat(cat, ', ') "
+                       'FROM complaint_cats WHERE cid = c.id), c.assignee, c.status FROM complaints c '
+                       'WHERE c.status = ? AND (c.priority, c.id) > (?, ?)')
+    COMPLAINT_FILTERS = {'cat': 'EXISTS (SELECT 1 FROM complaint_cats WHERE cat = ? AND cid = c.id)',
+                         'start': 'c.date >= ?', 'end': 'c.date < ?'}
+    COMPLAINT_ORDER = ' ORDER BY c.priority, c.id LIMIT ?'
+    SERVICE_QUEUE = ('SELECT rowid, priority, sched, room, service, call, assignee, status FROM services '
+                     'WHERE status = ? AND (priority, sched, rowid) > (?, ?, ?)')
+    SERVICE_FILTERS = {'service': 'service = ?', 'start': 'sched >= ?', 'end': 'sched < ?'}
+    SERVICE_ORDER = ' ORDER BY priority, sched, rowid LIMIT ?'
+    TRIAGE = {'complaints': 'UPDATE complaints SET status = ?, priority = ?, assignee = ? WHERE id = ?',
+              'services': 'UPDATE services SET status = ?, priority = ?, assignee = ? WHERE rowid = ?'}
+
+    COMPLAINT_COUNTS = 'SELECT cat, n FROM complaint_counts WHERE n > 0 ORDER BY n DESC, cat'
+    SERVICE_VOLUMES = ('SELECT service, substr(day, 1, 7) AS month, sum(booked) FROM service_load '
+                       'GROUP BY service, month HAVING sum(booked) > 0 ORDER BY month, service')
+
+    def __init__(self, path='database/manager_dat.db', readonly=False, legacy=None, **kwargs):
+
+        # connecting and bringing the schema up to date, kwargs are passed on to sqlite3.connect
+        self.dbcon = connect(path, **kwargs)
+        migrate(self.dbcon, MANAGER_MIGRATIONS)
+
+        # complaints, an old complaints.json (legacy, next to the database if None) is imported the first time
+        # by a connection which writes, a database in memory has no folder so it never imports one
+        if legacy is None and not readonly and path != ':memory:':
+            legacy = os.path.join(os.path.dirname(path), LEGACY_FILE)
+        self.complaints = ComplaintStore(self.dbcon, legacy)
+
+        # connections only used for reading are stopped from writing once the schema is ready
+        if readonly:
+            read_only(self.dbcon)
+
+    def batch(self):
+        # transaction grouping several writes, used by the database worker
+        return transaction(self.dbcon)
+
+    @property
+    def stats(self):
+        # lock statistics of the database
+        return self.dbcon.stats
+
+    def close(self):
+        self.dbcon.close()
+
+    def history_page(self, room, before, limit):
+
+        """
+        a page of a room's request history, most recent first, older than the row 'before'
+        :param before: (rowid, date, type, req) row to page from, None for the most recent requests
+        :return: list of (rowid, date, type, req)
+        """
+
+        rowid, date_ = (before[0] or MAX_ROWID, before[1]) if before else (MAX_ROWID, '9999-12-31')
+        return self.dbcon.execute(self.HISTORY_PAGE, (room, date_, rowid, limit)).fetchall()
+
+    def forum_page(self, before, limit):
+
+        """
+        a page of forum messages, newest first, older than the row 'before'
+        once the forum table runs out the page carries on into the archive, so older months are only read
+        when the chat is scrolled back to them
+        :param before: (rowid, room, date, content) row to page from, None for the newest messages
+        :return: list of (rowid, room, date, content)
+        """
+
+        rowid, date_ = (before[0], before[2]) if before else (MAX_ROWID, '9999-12-31')
+        page = self.dbcon.execute(self.FORUM_PAGE, (date_, rowid, limit)).fetchall()
+
+        if len(page) < limit:
+            rowid, date_ = (page[-1][0], page[-1][2]) if page else (rowid, date_)
+            page += self.dbcon.execute(self.ARCHIVE_PAGE, (date_, rowid, limit - len(page))).fetchall()
+        return page
+
+    def archive_forum(self, cutoff=None, limit=ARCHIVE_BATCH):
+
+        """
+        moves up to limit messages from before cutoff into forum_archive, in one short transaction
+        so it can be called repeatedly in the background without holding up other writes
+        :param cutoff: date string, retention_cutoff() if None
+        :return: number of messages moved, less than limit once there is nothing left to move
+        """
+
+        cutoff = cutoff or retention_cutoff()
+        with transaction(self.dbcon):
+            moved = self.dbcon.execute(self.ARCHIVE_FORUM, (cutoff, limit)).rowcount
+            self.dbcon.execute(self.DELETE_ARCHIVED, (cutoff, limit))
+        return moved
+
+    def data_version(self):
+        # changes whenever another connection commits to the database, checking it costs almost nothing
+        return self.dbcon.execute('PRAGMA data_version').fetchone()[0]
+
+    def forum_last(self):
+        # rowid of the newest forum message, 0 if there are none
+        return self.dbcon.execute(self.FORUM_LAST).fetchone()[0] or 0
+
+    def forum_since(self, rowid, limit=100):
+        # forum messages newer than rowid, oldest first
+        return self.dbcon.execute(self.FORUM_SINCE, (rowid, limit)).fetchall()
+
+    def search_forum(self, text, offset=0, limit=10):
+
+        """
+        forum messages matching the words typed, archived ones included, best matches first
+        :return: list of (rowid, room, date, snippet)
+        """
+
+        query = match_query(text)
+        if not query: return []
+        return [row[:4] for row in self.dbcon.execute(self.SEARCH_FORUM, (query, query, limit, offset))]
+
+    def search_complaints(self, room, text, offset=0, limit=10):
+
+        """
+        complaints of a room matching the words typed in their subject or description, best matches first
+        :return: list of (id, date, subject, snippet)
+        """
+
+        query = match_query(text)
+        if not query: return []
+        return self.dbcon.execute(self.SEARCH_COMPLAINTS, (query, room, limit, offset)).fetchall()
+
+    def request_counts(self, by=REQUEST_GROUPS):
+
+        """
+        number of requests grouped by any of type, room and month, read from the request_counts summary
+        :return: list of (*by, count)
+        """
+
+        if not by or any(column not in REQUEST_GROUPS for column in by):
+            raise ValueError(f'requests can only be grouped by {", ".join(REQUEST_GROUPS)}')
+
+        columns = ', '.join(by)
+        return self.dbcon.execute(f'SELECT {columns}, sum(n) FROM request_counts GROUP BY {columns} '
+                                  f'HAVING sum(n) > 0 ORDER BY {columns}').fetchall()
+
+    def complaint_counts(self):
+        # number of complaints in each category, most common first
+        return self.dbcon.execute(self.COMPLAINT_COUNTS).fetchall()
+
+    def service_volumes(self):
+        # bookings of each service by the month they are scheduled in, from service_load
+        return self.dbcon.execute(self.SERVICE_VOLUMES).fetchall()
+
+    def queue(self, table, after=None, limit=20, status='open', start=None, end=None, **filters):
+
+        """
+        a page of a triage queue across all rooms, most urgent first and oldest first within a priority
+        :param table: 'complaints' or 'services'
+        :param after: last row of the previous page, None for the first page
+        :param start: earliest date, filed for complaints and scheduled for services
+        :param end: date the queue stops before
+        :param filters: cat=category for complaints, service=service for services, None for all
+        :return: complaints as (id, priority, date, room, subject, categories, assignee, status)
+                 services as (rowid, priority, scheduled, room, service, call, assignee, status)
+        """
+
+        if table not in QUEUES or set(filters) - {QUEUES[table]}:
+            raise ValueError(f'{table} has no triage queue with filters {", ".join(filters)}')
+        if status not in STATUSES:
+            raise ValueError(f'status must be one of {", ".join(STATUSES)}')
+
+        if table == 'complaints':
+            sql, conditions, order = self.COMPLAINT_QUEUE, self.COMPLAINT_FILTERS, self.COMPLAINT_ORDER
+            params = [status, *((after[1], after[0]) if after else (0, 0))]
+        else:
+            sql, conditions, order = self.SERVICE_QUEUE, self.SERVICE_FILTERS, self.SERVICE_ORDER
+            params = [status, *((after[1], after[2], after[0]) if after else (0, '', 0))]
+
+        # only the filters which are used go into the statement, so the planner can pick the index for them
+        for name, value in [*filters.items(), ('start', start), ('end', end)]:
+            if value is not None:
+                sql += ' AND ' + conditions[name]
+                params.append(value)
+
+        return self.dbcon.execute(sql + order, (*params, limit)).fetchall()
+
+    def triage(self, table, rowid, status, priority, assignee=None):
+
+        # sets the status, priority and assignee of a complaint or service, an empty assignee unassigns it
+
+        if table not in QUEUES:
+            raise ValueError(f'{table} has no triage queue')
+        if status not in STATUSES or priority not in PRIORITIES:
+            raise ValueError(f'unknown status {status} or priority {priority}')
+
+        with transaction(self.dbcon):
+            self.dbcon.execute(self.TRIAGE[table], (status, priority, assignee or None, rowid))
+
+    def export(self, table):
+
+        """
+        every row of a table, oldest first
+        :return: cursor, rows are fetched from sqlite as it is iterated so the table is never all in memory
+        """
+
+        if table not in EXPORTS:
+            raise ValueError(f'unknown table {table}')
+        return self.dbcon.execute(EXPORTS[table])
+
+    def add_message(self, room, content):
+
+        # adds a forum message and returns the row as it was stored
+        with transaction(self.dbcon):
+            rowid = self.dbcon.execute(self.ADD_MESSAGE, (room, content)).lastrowid
+        return self.dbcon.execute(self.GET_MESSAGE, (rowid,)).fetchone()
+
+    def full_days(self, service, start, end):
+        # days from start up to end on which the service is fully booked, as strings
+        return [d for d, in self.dbcon.execute(self.FULL_DAYS, (service, start, end, capacity(service)))]
+
+    def add_service(self, room, service, sched, call):
+
+        # books a service and records the request, returns the requests row
+        # raises FullyBooked if the service has no room left that day, checked inside the write transaction
+        with transaction(self.dbcon):
+            booked = self.dbcon.execute(self.SERVICE_LOAD, (service, sched)).fetchone()
+            if booked and booked[0] >= capacity(service):
+                raise FullyBooked(service, sched)
+
+            rowid = self.dbcon.execute(self.ADD_REQUEST, ('service', room, service)).lastrowid
+            self.dbcon.execute(self.ADD_SERVICE, (service, room, sched, call))
+        return self.dbcon.execute(self.GET_REQUEST, (rowid,)).fetchone()
+
+    def add_complaint(self, room, cat, sub, con, attachments=()):
+
+        # registers a complaint and records the request, both in one transaction, returns the requests row
+        # attachments are (digest, name, type, bytes) of photos already in the attachment store
+        with transaction(self.dbcon):
+            rowid = self.dbcon.execute(self.ADD_REQUEST, ('complaint', room, '-')).lastrowid
+            self.complaints.insert(room, cat, sub, con, attachments=attachments)
+        return self.dbcon.execute(self.GET_REQUEST, (rowid,)).fetchone()
+
+
+class UserRepository:
+
+    EXISTS = 'SELECT 1 FROM users WHERE rno = ?'
+    CHECK = 'SELECT 1 FROM users WHERE rno = ? AND pwd = ?'
+    ADD = 'INSERT INTO users VALUES (?, ?)'
+
+    def __init__(self, path='database/users.db', readonly=False, **kwargs):
+
+        # connecting and creating table for first time (incase database was deleted)
+        self.dbcon = connect(path, **kwargs)
+        migrate(self.dbcon, USER_MIGRATIONS)
+
+        if readonly:
+            read_only(self.dbcon)
+
+    def batch(self):
+        # transaction grouping several writes, used by the database worker
+        return transaction(self.dbcon)
+
+    @property
+    def stats(self):
+        # lock statistics of the database
+        return self.dbcon.stats
+
+    def close(self):
+        self.dbcon.close()
+
+    def exists(self, rno):
+        return self.dbcon.execute(self.EXISTS, (rno,)).fetchone() is not None
+
+    def check(self, rno, pwd):
+        # checking if room number and password match
+        return self.dbcon.execute(self.CHECK, (rno, pwd)).fetchone() is not None
+
+    def add(self, rno, pwd, rct=None):
+        # the receipt is checked by validate() before adding, it is not stored
+        with transaction(self.dbcon):
+            self.dbcon.execute(self.ADD, (rno, pwd))
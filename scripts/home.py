@@ -1,52 +1,82 @@
 import sqlite3
+from operator import methodcaller
 
 from customtkinter import *
+from scripts.client import RemoteError, RemoteUserRepository
 from scripts.custom_widgets import *
+from scripts.shards import ShardedUserRepository, router
+from scripts.users import validate
+from scripts.validation import ROOM, PASSWORD, RECEIPT
+from scripts.worker import DBWorker
 
 
-class Home(CTk):
+def sign_up_error(e):
+    # a duplicate room is refused by the unique key, locally or by the server, anything else is shown as it is
+    if isinstance(e, sqlite3.IntegrityError) or (isinstance(e, RemoteError) and e.status == 409):
+        return 'Room number already registered.'
+    # the server's sign-up checks answer with the same messages as validate()
+    return e.message if isinstance(e, RemoteError) else str(e)
+
+
+class Home(CTkFrame):
 
     """
-    Home class, it's a customtkinter window, which asks you for your password and username
+    Home class, it's the login view of the application window (see scripts.app), which asks you for your password
+    and username, on_login(room number) is called once they match
     """
 
-    def __init__(self):
+    def __init__(self, master, server=None, on_login=None):
 
         # basic aspects of window
 
         self.winWidth = 600
         self.winHeight = 500
-        super().__init__()
-        self.geometry(f'{self.winWidth}x{self.winHeight}+100+100')
-        self.title('Home Login')
+        super().__init__(master, fg_color='transparent')
 
-        # window will not be resizable
-        self.resizable(False, False)
+        self.on_login = on_login
 
         # room number, this will be changed to the login room no.
         self.rmno = None
 
-        # connecting to database
+        # connecting to database, the repository creates the table for first time (incase database was deleted)
+        # every room is looked up in the users.db of its building (see scripts.shards)
+        # with a server url the window is a thin client of server.py instead
 
-        self.dbcon = sqlite3.connect('database/users.db')
-        self.dbcur = self.dbcon.cursor()
+        if server:
+            reader = writer = lambda: RemoteUserRepository(server)
+        else:
+            reader = lambda: ShardedUserRepository(router, readonly=True)
+            writer = lambda: ShardedUserRepository(router)
 
-        # creating table for first time (incase database was deleted)
-        self.dbcur.execute('CREATE TABLE IF NOT EXISTS users(rno char(4) PRIMARY KEY, pwd varchar(24))')
+        self.users = reader()
+
+        # new users are written on a worker thread, so signing up never freezes the window
+        self.worker = DBWorker(self, writer)
 
         #adding widgets
         self.add_widgets()
 
-    def run(self):
+    def show(self):
+
+        # sizing the window for this view, window will not be resizable
+        self.master.geometry(f'{self.winWidth}x{self.winHeight}+100+100')
+        self.master.title('Home Login')
+        self.master.resizable(False, False)
+        self.place(x=0, y=0, relwidth=1, relheight=1)
 
-        """
-        simple run program that returns the room number after login
+        # starting again after a logout, binding enter key to login command
+        self.password.clear()
+        self.error.configure(text='')
+        self.master.bind('<Return>', self.login)
 
-        :return: room number logged into
-        """
-        self.mainloop()
+    def hide(self):
+        self.master.unbind('<Return>')
+        self.place_forget()
 
-        return self.rmno
+    def close(self):
+        # finishing sign-ups which are still queued
+        self.worker.close()
+        self.users.close()
 
     def add_widgets(self):
 
@@ -71,9 +101,6 @@ class Home(CTk):
         self.roomno = Entry(cred, 'Room Number', relx=0.1, rely=0.1)
         self.password = Entry(cred, 'Password', True, relx=0.1, rely=0.4)
 
-        #binding enter key to login command
-        self.bind('<Return>', self.login)
-
         # creating a label to show errors in the credentials
 
         self.error = CTkLabel(cred, text_color='#ff0000', font=('Arial Italics', 10), text='')
@@ -98,12 +125,13 @@ class Home(CTk):
 
         if all([self.roomno.get(), self.password.get()]):
 
-            # checks credentials and destroys window, returning 'mainloop' else shows error
+            # checks credentials and switches to the management view, else shows error
 
             if self.checkCredentials():
                 self.rmno = self.roomno.get()
                 self.error.configure(text='')
-                self.after(100, self.destroy())
+                if self.on_login:
+                    self.on_login(self.rmno)
             else:
                 self.error.configure(text='Invalid room number/password')
         else:
@@ -113,54 +141,21 @@ class Home(CTk):
 
     def create_user(self, win, rno, pwd, rct, error):
 
-        self.dbcur.execute('SELECT rno FROM users')
-        # getting all users from database
-        users = self.dbcur.fetchall()
-
-        """
-        checking password validity in order
-        1. checking if all the entries are filled using all()
-        2. checking if room number already exists by checking db
-        3. checking room number format
-        4. checking password format
-        5. checking if password contains all needed characters, alphabet, number, symbol
-        6. checking if password contains only allowed characters
-        7. checking if receipt number is valid
-        
-        if any of these are not right, it will display an error on the label
-        """
-
-        errormsg = ''
-        if not (all([rno, pwd, rct])):
-            errormsg = 'Please enter room number, password and receipt number.'
-
-        elif rno in [usr for usr, in users]: #user, because all values are stored as tuples
-            errormsg = 'Room number already registered.'
-
-        elif not (rno[:3].isnumeric() and len(rno) == 4 and rno[3].isalpha() and rno[3].isupper()):
-            errormsg = 'Room number is of form "***L" \nWhere * is numeric and L is an alphabet'
+        # checking the sign-up rules, the room number is looked up by primary key
+        # if any of these are not right, it will display an error on the label
 
-        elif not (4 < len(pwd) <= 24):
-            errormsg = 'Password must be 5 to 24 characters long.'
-
-        elif not (all([any([i in x for i in pwd.lower()]) for x in ['!@$_', '1234567890', 'qwertyuiopasdfghjklzxcvbnm']])):
-            errormsg = 'Password must be contain at least:\none special character, alphabet and number.'
-
-        elif any(i not in ''.join(['!@$_', '1234567890', 'qwertyuiopasdfghjklzxcvbnm']) for i in pwd.lower()):
-            errormsg = "Password must not contain characters other than \n!@$_, alphabets and numbers."
-
-        elif not (rct.isnumeric() and len(rct) == 10):
-            errormsg = 'Receipt Number must be a 10 digit numeric.'
+        errormsg = validate(rno, pwd, rct, self.users.exists)
 
         error.configure(text=errormsg)
 
         if not errormsg:
 
-            # adds user and destroys window, closing toplevel
-            self.dbcur.execute(f'INSERT INTO users values("{rno}", "{pwd}")')
-            self.dbcon.commit()
-
-            win.destroy()
+            # adds user and destroys window once saved, closing toplevel
+            # if someone registered the room in the meantime, the insert fails and the error is shown instead
+            # the server checks the sign-up rules again, so it is sent the receipt too
+            self.worker.submit(methodcaller('add', rno, pwd, rct),
+                               callback=lambda _: win.destroy(),
+                               errback=lambda e: error.configure(text=sign_up_error(e)))
 
 
     def add_user(self):
@@ -171,17 +166,18 @@ class Home(CTk):
         newUser.geometry('300x300+200+200')
         newUser.title('Sign Up')
 
-        # entries for all credentials
-
-        roomno = Entry(newUser, 'Room Number', relx=0.1, rely=0.1)
-        password = Entry(newUser, 'New Password', True, relx=0.1, rely=0.35)
-        reciept = Entry(newUser, 'Reciept Number', True, relx=0.1, rely=0.6)
-
         # label for errors
 
         error = CTkLabel(newUser, text='', text_color='#ff0000', font=('Arial Italics', 8))
         error.place(relx=0.1, rely=0.85)
 
+        # entries for all credentials, checked while typing and errors shown on the label
+
+        report = lambda msg: error.configure(text=msg)
+        roomno = Entry(newUser, 'Room Number', field=ROOM, report=report, relx=0.1, rely=0.1)
+        password = Entry(newUser, 'New Password', True, field=PASSWORD, report=report, relx=0.1, rely=0.35)
+        reciept = Entry(newUser, 'Reciept Number', True, field=RECEIPT, report=report, relx=0.1, rely=0.6)
+
         # vertical style button to create user
 
         CTkButton(newUser, text='C\nR\nE\nA\nT\nE', # all values are taken from entries using 'get()' method
@@ -203,12 +199,6 @@ class Home(CTk):
 
     def checkCredentials(self):
 
-        # checking if username and password match in DB, executes sql query and checking if any columns were returned
-
-        return bool(
-            len(
-                self.dbcur.execute(
-                    f'SELECT * FROM users WHERE rno = "{self.roomno.get()}" AND pwd = "{self.password.get()}"').fetchall()
-            )
-        )
+        # checking if username and password match in DB
 
+        return self.users.check(self.roomno.get(), self.password.get())
@@ -1,60 +1,117 @@
-import json
-import sqlite3
 from datetime import date, datetime
+from operator import methodcaller
 
 from customtkinter import *
-from tkcalendar import Calendar
 
-from scripts.custom_widgets import WinFrame, WinTabView, Entry, BlockText, CheckBoxGroup, Message
+from scripts.client import RemoteManagerRepository
+from scripts.complaints import CATEGORIES
+from scripts.custom_widgets import WinFrame, WinTabView, Entry, BlockText, CheckBoxGroup, ChatBox, SearchWindow
+from scripts.database import ManagerRepository, ARCHIVE_BATCH
+from scripts.models import Session, Service, Complaint
+from scripts.scheduling import Availability
+from scripts.shards import router, MANAGER_DB
+from scripts.timing import Timer, print_lock_report
+from scripts.validation import SUBJECT
+from scripts.worker import DBWorker
 
 
-class Manager(CTk):
+class Manager(CTkFrame):
     """
     A class to create the management app, so that the user can manage their apartment
+    it is a view of the application window (see scripts.app), shown in place of the login view after logging in
     """
 
-    def __init__(self, room_number):
+    # milliseconds between checks for new forum messages
+    SYNC_INTERVAL = 2000
 
-        # creating window with basic information
-        super().__init__()
-        self.geometry('700x500+100+100')
-        self.title(f'Room {room_number} Management')
+    def __init__(self, master, room_number, server=None, on_logout=None):
+
+        # timing startup, the report is printed once the view is first drawn
+        self.timer = Timer(f'Room {room_number} Management startup')
+
+        super().__init__(master, fg_color='transparent')
 
         self.room_number = room_number
+        self.server = server
+        self.on_logout = on_logout
 
         # creating a tab view
 
         self.options = WinTabView(self, width=680, height=480)
         self.options.place(x=10, y=10)
 
-        # creating a tab for all the options for apartment management
-
-        for tab in ['Home', 'Complaints', 'Services', 'Forum']:
-            self.options.add_tab(tab)
-
         # creating dctionary to story widgets which might be used
 
         self.complaints = {}
         self.services = {}
         self.forum = {}
 
-        # connecting to db and making required tables
+        # search windows which are open, closed on logout
+        self.windows = []
 
-        self.dbcon = sqlite3.connect('database/manager_dat.db')
-        self.dbcur = self.dbcon.cursor()
+        # connecting to db, the repository creates and migrates the required tables
+        # the window reads with its own connection and every write goes through the worker's connection,
+        # with a server url the window is a thin client of server.py instead
 
-        self.dbcur.execute(
-            'CREATE TABLE IF NOT EXISTS requests(type varchar(20), room char(4), date datetime, req varchar(20))')
-        self.dbcur.execute(
-            'CREATE TABLE IF NOT EXISTS services(service varchar(20), room char(4), date datetime, sched datetime, call bool)')
-        self.dbcur.execute('CREATE TABLE IF NOT EXISTS forum(room char(4), date datetime, con varchar(200))')
+        # the databases are the ones of the room's building (see scripts.shards)
 
-        self.dbcon.commit()
+        path = router.path(room_number, MANAGER_DB)
+        if server:
+            reader = writer = lambda: RemoteManagerRepository(server)
+        else:
+            reader = lambda: ManagerRepository(path, readonly=True)
+            writer = lambda: ManagerRepository(path)
 
-        self.requestHistory = []
+        with self.timer.section('database'):
+            self.db = reader()
+
+        # writes go through a worker thread with its own connection, so the window never waits on the database
+        self.worker = DBWorker(self, writer)
+
+        # photos of complaints are stored next to the database, so they can only be attached when it is opened here
+        # the store is opened with the complaints tab
+        self.attachments = None
+
+        # request history and forum messages read so far, the tabs show them from here and write through it
+        self.session = Session(self.db, self.worker, room_number)
+
+        # creating a tab for all the options for apartment management
+        with self.timer.section('tabs'):
+            self.build_tabs()
 
-        self.build_tabs()
-        self.mainloop()
+        self.after(0, self.first_paint)
+
+    def show(self):
+
+        # sizing the window for this view and filling it
+        self.master.geometry('700x500+100+100')
+        self.master.title(f'Room {self.room_number} Management')
+        self.master.resizable(True, True)
+        self.place(x=0, y=0, relwidth=1, relheight=1)
+
+    def close(self):
+
+        # stopping everything the view runs in the background, finishing writes which are still queued
+        # the view is hidden and can be destroyed afterwards
+
+        if 'sync' in self.forum:
+            self.after_cancel(self.forum['sync'])
+        if 'poll' in self.complaints:
+            self.after_cancel(self.complaints['poll'])
+        for window in self.windows:
+            if window.winfo_exists(): window.destroy()
+
+        self.worker.close()
+        self.db.close()
+        if self.attachments:
+            self.attachments.close()
+        print_lock_report()
+
+        self.place_forget()
+
+    def logout(self):
+        if self.on_logout:
+            self.on_logout()
 
     def addframe(self, width=100, height=100, **kwargs):
 
@@ -67,148 +124,312 @@ class Manager(CTk):
 
     def build_tabs(self):
 
+        # registering a builder for every tab, a tab is only built the first time it is opened
+        # only the home tab is built straight away, so opening the window does not wait on the other tabs
+
+        for tab, builder in [('Home', self.build_home),
+                             ('Complaints', self.build_complaints),
+                             ('Services', self.build_services),
+                             ('Forum', self.build_forum)]:
+            self.options.add_tab(tab, builder=self.timer.wrap(f'{tab} tab', builder))
+
+        self.options.build(self.options.get())
+
+    def build_home(self, tab):
+
         # Building Home Tab
 
         # getting recent requests from db and creating table
 
-        self.dbcur.execute(f'SELECT date, type, req FROM requests WHERE room = "{self.room_number}"')
+        self.service_table = tab.createtable(f'Service History for Room {self.room_number}',
+                                             ['date', 'type', 'request'],
+                                             400, 300,
+                                             # pages of requests, more recent requests come first
+                                             fetch=self.session.requests.page,
+                                             relx=0.5, rely=0.1, anchor='n')
+
+        # the page shown is read again from the session whenever a request is added, saved or dropped
+        self.session.subscribe('requests', lambda event, request: self.service_table.load())
+
+        # going back to the login view, without closing the app
+        CTkButton(tab, text='Logout', width=80, fg_color='#354545', command=self.logout).place(relx=1, x=-10, y=10,
+                                                                                               anchor='ne')
 
-        self.service_table = self.options.tab('Home').createtable(f'Service History for Room {self.room_number}',
-                                                                  ['date', 'type', 'request'],
-                                                                  400, 300,
-                                                                  list(self.dbcur.fetchall())[::-1],
-                                                                  # more recent requests come first
-                                                                  relx=0.5, rely=0.1, anchor='n')
+    def build_complaints(self, tab):
 
         # Building Complaints Tab
 
         # creating label
-        CTkLabel(self.options.tab('Complaints'), text='Register Complaint.', font=('Calibri Bold', 24)).place(relx=0.5,
-                                                                                                              y=10,
-                                                                                                              anchor='n')
+        CTkLabel(tab, text='Register Complaint.', font=('Calibri Bold', 24)).place(relx=0.5, y=10, anchor='n')
 
         # creating entries and textblock
-        self.complaints['sub'] = Entry(self.options.tab('Complaints'), 'Subject', width=450, x=10, y=40)
-        self.complaints['con'] = BlockText(self.options.tab('Complaints'), 'Description', width=450, height=300, x=10,
-                                           y=120)
+        self.complaints['sub'] = Entry(tab, 'Subject', width=450, field=SUBJECT, x=10, y=40)
+        self.complaints['con'] = BlockText(tab, 'Description', width=450, height=300, x=10, y=120)
 
         # check box group for type of complaint
-        self.complaints['cat'] = CheckBoxGroup(self.options.tab('Complaints'), 'Categories',
-                                               ['Service', 'Maintenance', 'Noise', 'Pest', 'Other'], 190, x=470, y=40)
+        self.complaints['cat'] = CheckBoxGroup(tab, 'Categories', CATEGORIES, 190, x=470, y=40)
 
         # button to register complaint
-        self.complaints['but'] = CTkButton(self.options.tab('Complaints'), command=self.register_complaint,
+        self.complaints['but'] = CTkButton(tab, command=self.register_complaint,
                                            text='Register', font=('Arial Bold', 24), width=190, height=50,
                                            fg_color='#354545').place(x=470, y=400, anchor='sw')
 
-        # Building Complaints Tab
+        # searching this room's complaints
+        CTkButton(tab, text='Search Complaints', font=('Arial Bold', 16), width=190, height=35, fg_color='#354545',
+                  command=self.search_complaints).place(x=470, y=280)
+
+        # attaching photos, they are stored in the background and only their thumbnails are shown under the button
+        # (clicking a thumbnail removes it)
+        # PIL and the attachment store are only needed from here, so they are imported when the tab is first opened
+        self.complaints['files'] = []
+        self.complaints['pending'] = []
+        if not self.server:
+            from scripts.attachments import AttachmentStore, ATTACHMENTS
+            self.attachments = AttachmentStore(router.path(self.room_number, ATTACHMENTS))
+
+            CTkButton(tab, text='Attach Photos', font=('Arial Bold', 14), width=190, height=28, fg_color='#354545',
+                      command=self.attach_photos).place(x=470, y=318)
+            self.complaints['thumbs'] = CTkFrame(tab, width=190, height=44, fg_color='transparent')
+            self.complaints['thumbs'].place(x=470, y=405)
+
+    def attach_photos(self):
+
+        # storing the chosen photos in the background, polling for them if nothing was being stored already
+
+        from tkinter import filedialog
+        from scripts.attachments import TYPES
+
+        polling = bool(self.complaints['pending'])
+        for path in filedialog.askopenfilenames(title='Attach Photos', filetypes=TYPES):
+            self.complaints['pending'].append(self.attachments.submit(path))
+
+        if not polling:
+            self.poll_attachments()
+
+    def poll_attachments(self):
+
+        # adding the photos which are stored, a file which is not an image is left out
+
+        pending = self.complaints['pending']
+        for future in [f for f in pending if f.done()]:
+            pending.remove(future)
+            try:
+                self.complaints['files'].append(future.result())
+            except Exception:
+                self.bell()
+
+        self.show_thumbnails()
+        if pending:
+            self.complaints['poll'] = self.after(100, self.poll_attachments)
+        else:
+            self.complaints.pop('poll', None)
+
+    def show_thumbnails(self):
 
-        CTkLabel(self.options.tab('Services'),
+        # a thumbnail for each of the first four photos, and how many more there are
+
+        from PIL import Image
+
+        strip = self.complaints['thumbs']
+        for widget in strip.winfo_children():
+            widget.destroy()
+
+        files = self.complaints['files']
+        for i, file in enumerate(files[:4]):
+            image = CTkImage(Image.open(self.attachments.thumbnail(file[0])), size=(40, 40))
+            thumb = CTkLabel(strip, text='', image=image, width=40, height=40)
+            thumb.place(x=i * 46, y=2)
+            thumb.bind('<Button-1>', lambda e, file=file: self.remove_photo(file))
+
+        if len(files) > 4:
+            CTkLabel(strip, text=f'+{len(files) - 4}', width=6).place(x=184, y=12)
+
+    def remove_photo(self, file):
+        self.complaints['files'].remove(file)
+        self.show_thumbnails()
+
+    def build_services(self, tab):
+
+        # Building Services Tab
+
+        # tkcalendar is only needed here, so it is imported when the tab is first opened
+        from tkcalendar import Calendar
+
+        CTkLabel(tab,
                  text='Request Services.',
                  font=('Calibri Bold', 24)
                  ).place(relx=0.5, y=10, anchor='n')
 
         # choice of what service is required
 
-        self.services['ser'] = self.options.tab('Services').createchoice('Service',
-                                                                         ['Plumbing', 'Electrician', 'Cleaning',
-                                                                          'Technician'], x=10, y=50)
+        self.services['ser'] = tab.createchoice('Service', ['Plumbing', 'Electrician', 'Cleaning', 'Technician'],
+                                                x=10, y=50)
 
         # creating a frame for calendar
-        f = self.options.tab('Services').addframe(x=230, y=50, width=440, height=370)
+        f = tab.addframe(x=230, y=50, width=440, height=370)
         CTkLabel(f, text='Choose Date:', font=('Calibri Bold', 20)).place(x=10, y=10)
         # calendar to choose date
         self.services['cal'] = Calendar(f, width=920, height=640, date_pattern='mm/dd/y', font=('Calibri', 16),
                                         mindate=datetime.now())
         self.services['cal'].place(relx=0.5, y=50, anchor='n')
 
+        # fully booked days are greyed out, from the cached availability whenever the month or service changes
+        self.availability = Availability(self.db)
+        self.services['cal'].tag_config('full', background='grey', foreground='white')
+        self.services['cal'].bind('<<CalendarMonthChanged>>', self.mark_full_days)
+        self.services['ser'].configure(command=self.mark_full_days)
+        self.mark_full_days()
+
         # logo of cleaning service
-        self.options.tab('Services').addimage('pyclean', 150, 150, x=110, y=150, anchor='n')
+        tab.addimage('pyclean', 150, 150, x=110, y=150, anchor='n')
 
         # checkbox to call
-        self.services['che'] = CTkCheckBox(self.options.tab('Services'), text='Call Prior?')
+        self.services['che'] = CTkCheckBox(tab, text='Call Prior?')
         self.services['che'].place(x=10, y=325)
 
         # button to request service
-        CTkButton(self.options.tab('Services'), text='Schedule', font=('Calibri Bold', 20),
+        CTkButton(tab, text='Schedule', font=('Calibri Bold', 20),
                   command=self.request_service, width=200, height=40).place(x=10, y=370)
 
+        # label to show why a service could not be booked
+        self.services['err'] = CTkLabel(tab, text='', text_color='#ff0000', font=('Arial Italics', 10))
+        self.services['err'].place(x=10, y=412)
+
+    def mark_full_days(self, *args):
+
+        # marking the days of the shown month which the chosen service has no room left on
+
+        cal = self.services['cal']
+        month, year = cal.get_displayed_month()
+
+        cal.calevent_remove(tag='full')
+        for day in self.availability.full_days(self.services['ser'].get(), year, month):
+            cal.calevent_create(day, 'Fully booked', 'full')
+
+    def build_forum(self, tab):
+
         # Building Forum Tab
 
-        CTkLabel(self.options.tab('Forum'),
+        CTkLabel(tab,
                  text='Chat with Members',
                  font=('Calibri Bold', 24)
                  ).place(x=505, y=10, anchor='n')
 
+        # searching every message in the forum
+        CTkButton(tab, text='Search', width=50, command=self.search_forum).place(x=620, y=12)
+
         # creating textbox for message content, 200 word limit
-        self.forum['con'] = BlockText(self.options.tab('Forum'), 'Content', m=199, width=350, height=370, x=10,
-                                      y=10)
+        self.forum['con'] = BlockText(tab, 'Content', m=199, width=350, height=370, x=10, y=10)
 
         # send button invokes send message function
 
-        CTkButton(self.options.tab('Forum'), text='Send', font=('Calibri Bold', 20), command=self.send_message,
+        CTkButton(tab, text='Send', font=('Calibri Bold', 20), command=self.send_message,
                   width=330, height=40).place(x=20, y=385)
 
-        # getting messages from forum
-        self.dbcur.execute(f'SELECT room, date d, con FROM forum where strftime("%Y", d) = strftime("%Y", date())')
-
-        # creatin a scrollable frame to put chat messages
-        self.forum['chatbox'] = CTkScrollableFrame(self.options.tab('Forum'), width=290, height=365)
-        self.forum['chatbox'].place(x=360, y=50)
-        for i, message in enumerate(self.dbcur.fetchall()):
-            # putting messages in for each message
-            Message(self.forum['chatbox'], 200, *message).pack(expand=True,
-                                                               anchor='e' if message[0] == self.room_number else 'w',
-                                                               pady=10)
+        # creating a chatbox which only renders the messages on screen, pages are loaded from forum while scrolling
+        self.forum['chatbox'] = ChatBox(tab, 310, 365, self.room_number, self.session.forum.page, x=360, y=50)
+        self.session.subscribe('forum', self.show_post)
 
         # when chatbox comes onto screen, it scrolls down to the bottom
-        self.forum['chatbox'].bind('<Visibility>', lambda e: self.forum['chatbox']._parent_canvas.yview_moveto(1.0))
+        self.forum['chatbox'].bind('<Visibility>', lambda e: self.forum['chatbox'].scroll_to_bottom())
+
+        # checking for messages from other rooms every few seconds
+        self.forum['sync'] = self.after(self.SYNC_INTERVAL, self.sync_forum)
+
+    def sync_forum(self):
+        # adding messages from other rooms to the session, which shows them through show_post
+        self.session.sync_forum()
+        self.forum['sync'] = self.after(self.SYNC_INTERVAL, self.sync_forum)
+
+    def show_post(self, event, post):
+
+        # a message was added to the session, or one sent from here was saved or could not be sent
+        chatbox = self.forum['chatbox']
+        if event == 'added':
+            chatbox.append(post)
+        elif event == 'saved':
+            chatbox.render()
+        else:
+            chatbox.replace_row(post)
+
+    def search_forum(self):
+
+        # opening a search window over forum messages
+
+        def search(text, offset, limit):
+            return [f"Room {room}  {date[:16]}\n{snippet}"
+                    for _, room, date, snippet in self.db.search_forum(text, offset, limit)]
+
+        self.windows.append(SearchWindow('Search Forum', search))
+
+    def search_complaints(self):
+
+        # opening a search window over this room's complaints
+
+        def search(text, offset, limit):
+            return [f"#{cid}  {sub}  {(date or '')[:10]}\n{snippet}"
+                    for cid, date, sub, snippet in self.db.search_complaints(self.room_number, text, offset, limit)]
+
+        self.windows.append(SearchWindow('Search Complaints', search))
+
+    def first_paint(self):
+
+        # called once the event loop is running, drawing everything pending before taking the time
+        self.update_idletasks()
+        self.timer.mark('first paint')
+        self.timer.print_report()
+
+        # moving old forum messages to the archive now that the window is up, the server archives its own
+        if not self.server:
+            self.archive_forum()
+
+    def archive_forum(self, moved=ARCHIVE_BATCH):
+
+        # archives a batch at a time on the worker, queueing the next batch until a batch comes back short
+        # so messages sent meanwhile are never stuck behind one long transaction
+        if moved == ARCHIVE_BATCH:
+            self.worker.submit(methodcaller('archive_forum'), callback=self.archive_forum)
 
     def send_message(self):
 
-        # sends a message in chat, and record it in db, also adds a message to the frame
-        self.dbcur.execute(
-            f'INSERT INTO forum values("{self.room_number}", datetime(), "{self.forum["con"].get().strip()}")')
-        self.dbcon.commit()
+        # sends a message in chat, the message shows straight away and is updated once it's in db
+        self.session.post(self.forum["con"].get().strip())
 
-        Message(self.forum['chatbox'], 200, self.room_number, datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                self.forum["con"].get().strip()).pack(expand=True, anchor='e', pady=10)
         self.forum['con'].clear()
-        self.forum['chatbox'].after(10, self.forum['chatbox']._parent_canvas.yview_moveto, 1.0)
+        self.forum['chatbox'].scroll_to_bottom()
 
     def request_service(self):
 
-        # requests a service, by adding it to DB and adding to recents
+        # requests a service, by adding it to DB and adding to recents, unless the day is fully booked
         m, d, y = (int(i) for i in self.services['cal'].get_date().split('/'))
         service = self.services['ser'].get()
 
-        self.dbcur.execute(f'INSERT INTO requests values("service", "{self.room_number}", date(), "{service}")')
-        self.dbcur.execute(
-            f'INSERT INTO services values("{service}", "{self.room_number}", date(), "{date(y, m, d)}", {str(bool(self.services["che"].get())).lower()})')
+        if self.availability.is_full(service, date(y, m, d)):
+            self.services['err'].configure(text=f'{service} is fully booked on {d}/{m}/{y}')
+            return
+        self.services['err'].configure(text='')
 
-        self.dbcon.commit()
-
-        self.service_table.add_row([datetime.now().strftime('%Y-%m-%d'), 'service', service])
+        # the capacity is checked again when writing, in case someone else took the last booking
+        self.session.book_service(Service(self.room_number, service, str(date(y, m, d)),
+                                          bool(self.services["che"].get())),
+                                  saved=self.mark_full_days,
+                                  failed=lambda e: self.services['err'].configure(text=str(e)))
 
     def register_complaint(self):
 
-        # registers complaint by adding to json db and adding to recents
-        with open('database/complaints.json') as c:
-            complaints = json.load(c)
+        # registers complaint in the complaint store and the requests table in one transaction and adding to recents
+        # waits for photos which are still being stored
+        if self.complaints['pending']:
+            self.bell()
+            return
 
-        complaints[f"c{len(complaints)}"] = {
-            'room': self.room_number,
-            'cat': self.complaints['cat'].getselected(),
-            'sub': self.complaints['sub'].get(),
-            'con': self.complaints['con'].get()
-        }
+        self.session.file_complaint(Complaint(self.room_number, self.complaints['cat'].getselected(),
+                                              self.complaints['sub'].get(), self.complaints['con'].get(),
+                                              self.complaints['files']))
 
         for w in ['sub', 'cat', 'con']:
             self.complaints[w].clear()
 
-        json.dump(complaints, open('database/complaints.json', 'w'))
-        self.dbcur.execute(f'INSERT INTO requests values("complaint", "{self.room_number}", date(), "-")')
-        self.dbcon.commit()
-
-        # addrow is used to add to recents table
-        self.service_table.add_row([datetime.now().strftime('%Y-%m-%d'), 'complaint', '-'])
+        if self.complaints['files']:
+            self.complaints['files'] = []
+            self.show_thumbnails()
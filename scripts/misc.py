@@ -1,8 +1,8 @@
-from os import listdir
+from scripts.assets import registry
 
 
 # get asset function
 def getAsset(type, filename):
-    # gets required asset from the given type and filename in the assets folder
+    # gets required asset from the given type and filename in the assets folder, the folder is only listed once
 
-    return f'assets/{type}s/{[f for f in listdir(f"assets/{type}s/") if f.startswith(filename)][0]}'
+    return registry.path(type, filename)
@@ -0,0 +1,225 @@
+from datetime import date, datetime
+from operator import methodcaller
+
+"""
+ Model layer, compact records for what a logged in room works with and a cache of them for the session
+ Request : a row of the room's request history
+ Post : a forum message
+ Service : a service booking, before it is written
+ Complaint : a complaint, before it is written
+
+ records have __slots__ so the thousands of forum messages a chat can hold don't each carry a __dict__,
+ and they unpack and index like the rows the repositories return, so widgets take either
+
+ Session keeps the request history and forum messages which have been read, every page is only read once,
+ writes made through the session are added to the cache straight away and the views subscribed to it are told
+ when a record is added, saved or dropped, so no view reads the database again or builds rows of its own
+"""
+
+
+class Record:
+
+    __slots__ = ()
+
+    def __init__(self, *values):
+        for name, value in zip(self.__slots__, values):
+            setattr(self, name, value)
+
+    def __iter__(self):
+        return (getattr(self, name) for name in self.__slots__)
+
+    def __getitem__(self, i):
+        return tuple(self)[i]
+
+    def __repr__(self):
+        return f'{type(self).__name__}{tuple(self)}'
+
+    def update(self, row):
+        # taking the values of the row as it was saved, the record stays the same object for the views holding it
+        for name, value in zip(self.__slots__, row):
+            setattr(self, name, value)
+
+
+class Request(Record):
+
+    __slots__ = ('rowid', 'date', 'type', 'req')
+
+    @classmethod
+    def pending(cls, type, req):
+        # a request which is not saved yet
+        return cls(None, str(date.today()), type, req)
+
+
+class Post(Record):
+
+    __slots__ = ('rowid', 'room', 'date', 'content')
+
+    @classmethod
+    def pending(cls, room, content):
+        return cls(None, room, datetime.now().strftime('%Y-%m-%d %H:%M:%S'), content)
+
+
+class Service(Record):
+
+    # in the order ManagerRepository.add_service takes them
+    __slots__ = ('room', 'service', 'sched', 'call')
+
+
+class Complaint(Record):
+
+    # in the order ManagerRepository.add_complaint takes them
+    __slots__ = ('room', 'cat', 'sub', 'con', 'attachments')
+
+
+class Pages:
+
+    """
+    records of a paged query, newest first, read from the database as far as they have been asked for
+    fetch(before, limit) is the repository's page function, see ManagerRepository.history_page,
+    it is given plain tuples so the remote repositories can send them as json
+    """
+
+    def __init__(self, fetch, record):
+        self.fetch = fetch
+        self.record = record
+        self.records = []
+        self.complete = False
+
+    def page(self, before, limit):
+
+        # the records after before (from the newest if None), reading more pages only when the cache runs out
+
+        start = 0
+        if before is not None:
+            for start, record in enumerate(self.records, 1):
+                if record is before:
+                    break
+            else:
+                # not a cached record, read straight from the database
+                return [self.record(*row) for row in self.fetch(tuple(before), limit)]
+
+        while len(self.records) < start + limit and not self.complete:
+            oldest = self.oldest()
+            rows = self.fetch(tuple(oldest) if oldest else None, limit)
+            self.complete = len(rows) < limit
+            self.records += [self.record(*row) for row in rows]
+
+        return self.records[start:start + limit]
+
+    def oldest(self):
+        # the oldest saved record, pages are read from before it
+        for record in reversed(self.records):
+            if record.rowid is not None:
+                return record
+        return None
+
+    def add(self, record):
+        self.records.insert(0, record)
+
+    def remove(self, record):
+        for i, cached in enumerate(self.records):
+            if cached is record:
+                del self.records[i]
+                return
+
+
+class Session:
+
+    def __init__(self, db, worker, room):
+
+        """
+        the cache of a logged in room, all of it is used on the Tk thread
+        :param db: repository the window reads with
+        :param worker: DBWorker the writes go through
+        """
+
+        self.db = db
+        self.worker = worker
+        self.room = room
+
+        self.requests = Pages(lambda before, limit: db.history_page(room, before, limit), Request)
+        self.forum = Pages(db.forum_page, Post)
+
+        # callbacks of every topic, called with (event, record)
+        self.observers = {'requests': [], 'forum': []}
+
+        # newest forum message when the session started, syncing picks up after it
+        self.last = db.forum_last()
+        self.version = db.data_version()
+
+    def subscribe(self, topic, callback):
+        # callback(event, record) is called after 'added', 'saved' or 'dropped' of a record of the topic
+        self.observers[topic].append(callback)
+
+    def notify(self, topic, event, record):
+        for callback in self.observers[topic]:
+            callback(event, record)
+
+    def write(self, topic, record, fn, *args, saved=None, failed=None):
+
+        """
+        adds record to the cache straight away and queues fn(repository, *args) on the worker
+        the record is updated with the saved row (or dropped if the write failed) once the worker is done
+        saved(record) or failed(exception) is called after that
+        """
+
+        pages = getattr(self, topic)
+        pages.add(record)
+        self.notify(topic, 'added', record)
+
+        def callback(row):
+            # syncing the forum may have seen the saved row already
+            if record.rowid is None:
+                record.update(row)
+                self.notify(topic, 'saved', record)
+            if saved: saved(record)
+
+        def errback(e):
+            pages.remove(record)
+            self.notify(topic, 'dropped', record)
+            if failed: failed(e)
+
+        self.worker.submit(methodcaller(fn, *args), callback=callback, errback=errback)
+        return record
+
+    def book_service(self, service, **kwargs):
+        return self.write('requests', Request.pending('service', service.service), 'add_service', *service, **kwargs)
+
+    def file_complaint(self, complaint, **kwargs):
+        return self.write('requests', Request.pending('complaint', '-'), 'add_complaint', *complaint, **kwargs)
+
+    def post(self, content, **kwargs):
+        return self.write('forum', Post.pending(self.room, content), 'add_message', self.room, content, **kwargs)
+
+    def sync_forum(self):
+
+        # adding messages written since the last check, nothing is read unless the database has changed
+
+        version = self.db.data_version()
+        if version == self.version: return
+        self.version = version
+
+        while rows := self.db.forum_since(self.last):
+            for row in rows:
+                self.merge(row)
+            self.last = rows[-1][0]
+
+    def merge(self, row, recent=50):
+
+        """
+        adds a message which was written by someone else, unless it is already cached
+        a message sent from here which is not saved yet and matches it is saved with it instead
+        only the newest few are checked, new messages are always the newest
+        """
+
+        for post in self.forum.records[:recent]:
+            if post.rowid == row[0]:
+                return
+            if post.rowid is None and post.room == row[1] and post.content == row[3]:
+                post.update(row)
+                self.notify('forum', 'saved', post)
+                return
+
+        post = Post(*row)
+        self.forum.add(post)
+        self.notify('forum', 'added', post)
@@ -0,0 +1,159 @@
+import argparse
+import csv
+import json
+import os
+import sys
+from collections import Counter
+
+from scripts.database import ManagerRepository, REQUEST_GROUPS, EXPORTS
+from scripts.shards import router, MANAGER_DB
+
+"""
+ Reports for management, answered from the summary tables the database keeps up to date as requests are made
+ so no report scans requests, services or complaints, and exports of whole tables written out row by row
+
+ usage: python -m scripts.report requests --by type month
+        python -m scripts.report complaints --format jsonl
+        python -m scripts.report services --out services.csv
+        python -m scripts.report export forum --format jsonl --out forum.jsonl
+        python -m scripts.report requests --all-buildings
+"""
+
+FORMATS = ('csv', 'jsonl')
+
+
+def summary(db, name, by=REQUEST_GROUPS):
+
+    """
+    one of the summaries
+    :return: (header, rows)
+    """
+
+    if name == 'requests':
+        return list(by) + ['count'], db.request_counts(by)
+    if name == 'complaints':
+        return ['category', 'count'], db.complaint_counts()
+    if name == 'services':
+        return ['service', 'month', 'count'], db.service_volumes()
+    raise ValueError(f'unknown report {name}')
+
+
+def export(db, table):
+    # (header, rows) of a whole table, rows are read as they are written
+    cursor = db.export(table)
+    return [d[0] for d in cursor.description], cursor
+
+
+def empty(fn, *args):
+    # fn(db, *args) on an empty database in memory
+    db = ManagerRepository(':memory:')
+    try:
+        return fn(db, *args)
+    finally:
+        db.close()
+
+
+def summary_all(router, name, by=REQUEST_GROUPS):
+
+    """
+    a summary of every building together, each building's summary is read at the same time
+    and the counts of the same key are added up
+    :return: (header, rows)
+    """
+
+    totals = Counter()
+    header = None
+    for header, rows in router.fan_out(summary, name, by).values():
+        for *key, n in rows:
+            totals[tuple(key)] += n
+
+    if header is None:
+        # no building has a database yet, an empty one still gives the columns
+        header, _ = empty(summary, name, by)
+    return header, [(*key, n) for key, n in sorted(totals.items())]
+
+
+def export_all(router, table):
+
+    """
+    a whole table of every building, one building after another with the building's folder as the first column
+    :return: (header, rows)
+    """
+
+    directories = [d for d in router.directories() if os.path.exists(os.path.join(d, MANAGER_DB))]
+    header = ['building'] + empty(export, table)[0]
+
+    def rows():
+        for directory in directories:
+            db = ManagerRepository(os.path.join(directory, MANAGER_DB), readonly=True)
+            try:
+                for row in db.export(table):
+                    yield directory, *row
+            finally:
+                db.close()
+
+    return header, rows()
+
+
+def write(header, rows, out, format='csv'):
+
+    """
+    writes the rows one at a time, as csv with a header line or as one json object per line
+    :return: number of rows written
+    """
+
+    n = 0
+    if format == 'csv':
+        writer = csv.writer(out)
+        writer.writerow(header)
+        for n, row in enumerate(rows, 1):
+            writer.writerow(row)
+    else:
+        for n, row in enumerate(rows, 1):
+            out.write(json.dumps(dict(zip(header, row))) + '\n')
+    return n
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Request, complaint and service reports, and table exports.')
+    parser.add_argument('report', choices=['requests', 'complaints', 'services', 'export'])
+    parser.add_argument('table', nargs='?', choices=list(EXPORTS), help='table to export')
+    parser.add_argument('--by', nargs='+', choices=REQUEST_GROUPS, default=list(REQUEST_GROUPS),
+                        help='columns to group request counts by')
+    parser.add_argument('--format', choices=FORMATS, default='csv')
+    parser.add_argument('--out', help='file to write to, standard output if not given')
+    parser.add_argument('--db', default='database/manager_dat.db')
+    parser.add_argument('--all-buildings', action='store_true',
+                        help='report on every building in database/shards.json instead of --db')
+    args = parser.parse_args()
+
+    if args.report == 'export' and not args.table:
+        parser.error('export needs a table')
+
+    db = None
+    if args.all_buildings:
+        if args.report == 'export':
+            header, rows = export_all(router, args.table)
+        else:
+            header, rows = summary_all(router, args.report, args.by)
+    else:
+        db = ManagerRepository(args.db, readonly=True)
+        if args.report == 'export':
+            header, rows = export(db, args.table)
+        else:
+            header, rows = summary(db, args.report, args.by)
+
+    out = open(args.out, 'w', newline='') if args.out else sys.stdout
+    try:
+        n = write(header, rows, out, args.format)
+    finally:
+        if args.out: out.close()
+        if db: db.close()
+
+    if args.out:
+        print(f'{n} rows written to {args.out}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+from datetime import date
+
+"""
+ Service scheduling, every service can only be booked so many times a day
+ how many bookings each day has is kept in the service_load table, which triggers on services keep up to date,
+ so checking a day or a whole month never counts rows of services
+ Availability keeps the full days of each month the calendar has shown, and only asks the database again
+ after someone has written to it
+"""
+
+# bookings each service can take in a day
+CAPACITY = {
+    'Plumbing': 4,
+    'Electrician': 3,
+    'Cleaning': 6,
+    'Technician': 3,
+}
+
+# services not in CAPACITY
+DEFAULT_CAPACITY = 3
+
+
+class FullyBooked(Exception):
+
+    def __init__(self, service, day):
+        super().__init__(f'{service} is fully booked on {day}')
+        self.service = service
+        self.day = day
+
+
+def capacity(service):
+    return CAPACITY.get(service, DEFAULT_CAPACITY)
+
+
+def month_range(year, month):
+    # first day of the month and of the next month as strings, for an indexed range over service_load
+    return str(date(year, month, 1)), str(date(year + month // 12, month % 12 + 1, 1))
+
+
+class Availability:
+
+    def __init__(self, db):
+
+        # db is a repository, full days of a month are cached by (service, year, month)
+        self.db = db
+        self.months = {}
+        self.version = db.data_version()
+
+    def full_days(self, service, year, month):
+
+        """
+        days of the month the service cannot be booked on
+        :return: set of dates
+        """
+
+        # dropping the cache if anything was written since it was filled
+        version = self.db.data_version()
+        if version != self.version:
+            self.version = version
+            self.months.clear()
+
+        key = (service, year, month)
+        if key not in self.months:
+            self.months[key] = {date.fromisoformat(d) for d in self.db.full_days(service, *month_range(year, month))}
+
+        return self.months[key]
+
+    def is_full(self, service, day):
+        return day in self.full_days(service, day.year, day.month)
@@ -0,0 +1,131 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, ExitStack
+
+from scripts.database import ManagerRepository, UserRepository
+
+"""
+ Shards, every building can have its own users.db and manager_dat.db instead of sharing one pair of files
+ database/shards.json maps the start of a room number to the folder with that building's databases,
+ the longest matching prefix wins and rooms matching none use the default folder
+
+ {"default": "database", "buildings": {"1": "database/tower-a", "2": "database/tower-b"}}
+
+ without shards.json every room uses the database folder, the same as a single installation
+ a window only ever opens the shard of the room it is for, reports across buildings use fan_out()
+"""
+
+SHARDS_FILE = 'database/shards.json'
+
+USERS_DB = 'users.db'
+MANAGER_DB = 'manager_dat.db'
+
+
+class ShardRouter:
+
+    def __init__(self, path=SHARDS_FILE, default='database'):
+
+        config = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                config = json.load(f)
+
+        self.default = config.get('default', default)
+        self.buildings = config.get('buildings', {})
+
+        # longest prefixes first, so '12' is matched before '1'
+        self.prefixes = sorted(self.buildings, key=len, reverse=True)
+
+    def directory(self, room):
+        # folder with the databases of the building the room is in
+        for prefix in self.prefixes:
+            if room.startswith(prefix):
+                return self.buildings[prefix]
+        return self.default
+
+    def path(self, room, filename):
+        return os.path.join(self.directory(room), filename)
+
+    def directories(self):
+        # every shard's folder, once each
+        return list(dict.fromkeys([*self.buildings.values(), self.default]))
+
+    def fan_out(self, fn, *args, filename=MANAGER_DB):
+
+        """
+        calls fn(repository, *args) on every shard at once, each on its own thread and read only connection
+        shards which were never used (no database file) are left out
+        :return: {folder: result}, in the order of directories()
+        """
+
+        def read(directory):
+            repo = ManagerRepository(os.path.join(directory, filename), readonly=True)
+            try:
+                return fn(repo, *args)
+            finally:
+                repo.close()
+
+        directories = [d for d in self.directories() if os.path.exists(os.path.join(d, filename))]
+        if not directories: return {}
+
+        with ThreadPoolExecutor(len(directories)) as pool:
+            return dict(zip(directories, pool.map(read, directories)))
+
+
+class ShardedUserRepository:
+
+    """
+    same methods as UserRepository, every call goes to the users.db of the room's building
+    connections are opened the first time a building is used
+    """
+
+    def __init__(self, router, readonly=False, **kwargs):
+        self.router = router
+        self.readonly = readonly
+        self.kwargs = kwargs
+        self.repos = {}
+
+        # transactions of the batch which is running, a building joins it the first time it is written to
+        self.stack = None
+        self.joined = set()
+
+    def repo(self, rno):
+
+        directory = self.router.directory(rno)
+        if directory not in self.repos:
+            os.makedirs(directory, exist_ok=True)
+            self.repos[directory] = UserRepository(os.path.join(directory, USERS_DB), self.readonly, **self.kwargs)
+
+        repo = self.repos[directory]
+        if self.stack is not None and directory not in self.joined:
+            self.stack.enter_context(repo.batch())
+            self.joined.add(directory)
+        return repo
+
+    @contextmanager
+    def batch(self):
+
+        # transaction on every building written to in the block, all of them are rolled back if the block raises
+        with ExitStack() as self.stack:
+            try:
+                yield
+            finally:
+                self.stack = None
+                self.joined.clear()
+
+    def close(self):
+        for repo in self.repos.values():
+            repo.close()
+
+    def exists(self, rno):
+        return self.repo(rno).exists(rno)
+
+    def check(self, rno, pwd):
+        return self.repo(rno).check(rno, pwd)
+
+    def add(self, rno, pwd, rct=None):
+        self.repo(rno).add(rno, pwd, rct)
+
+
+router = ShardRouter()
@@ -0,0 +1,68 @@
+import json
+from contextlib import contextmanager
+from time import perf_counter
+
+from scripts import trace
+from scripts.connections import lock_report
+
+"""
+ Startup timing, records how long each step of opening a window takes
+ the report is printed when the PYAPARTMENTS_TIMING environment variable is set,
+ along with how long the window waited for database locks when it closes
+ sections are recorded in the trace as well, see scripts.trace
+"""
+
+ENABLED = trace.ENABLED
+
+
+class Timer:
+
+    def __init__(self, name):
+
+        self.name = name
+        self.start = perf_counter()
+
+        # (label, seconds) for every timed step, and (label, seconds since start) for every mark
+        self.sections = []
+        self.marks = []
+
+    @contextmanager
+    def section(self, label):
+        # times the block
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.sections.append((label, perf_counter() - start))
+            if ENABLED:
+                trace.event(label, 'build', start, self.sections[-1][1])
+
+    def wrap(self, label, fn):
+        # returns fn timed as a section every time it is called
+        def timed(*args, **kwargs):
+            with self.section(label):
+                return fn(*args, **kwargs)
+        return timed
+
+    def mark(self, label):
+        # records the time since the timer started
+        self.marks.append((label, perf_counter() - self.start))
+
+    def report(self):
+
+        # the report as text, steps first and then marks
+
+        lines = [f'{self.name}:']
+        lines += [f'  {label:<24}{t * 1000:9.1f} ms' for label, t in self.sections]
+        lines += [f'  {label:<24}{t * 1000:9.1f} ms after start' for label, t in self.marks]
+        return '\n'.join(lines)
+
+    def print_report(self):
+        if ENABLED:
+            print(self.report(), flush=True)
+
+
+def print_lock_report():
+    # lock statistics of every database the process opened
+    if ENABLED:
+        print('Database locks:', json.dumps(lock_report(), indent=2), flush=True)
@@ -0,0 +1,153 @@
+import atexit
+import json
+import os
+import threading
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+from time import perf_counter
+
+"""
+ Opt-in instrumentation, everything here is off unless the PYAPARTMENTS_TIMING environment variable is set
+ when it is on, the process records
+  - every sql statement, with its time and rows (see TracedConnection in scripts.connections)
+  - widget construction, for functions decorated with timed() and Timer sections
+  - stalls of the Tk event loop, measured by LagMonitor
+ and writes them to PYAPARTMENTS_TRACE (trace.json by default) when it exits
+
+ the file is in chrome's trace event format, so it can be opened in chrome://tracing, ui.perfetto.dev or
+ speedscope.app for a flamegraph of where the time went, statement and stall totals are under otherData
+"""
+
+ENABLED = bool(os.environ.get('PYAPARTMENTS_TIMING'))
+TRACE_FILE = os.environ.get('PYAPARTMENTS_TRACE', 'trace.json')
+
+# most events kept, the oldest are dropped after that
+MAX_EVENTS = 200000
+
+# milliseconds between heartbeats of LagMonitor, and how late one has to be to count as a stall
+HEARTBEAT = 50
+STALL = 100
+
+START = perf_counter()
+events = deque(maxlen=MAX_EVENTS)
+
+
+def event(name, cat, start, seconds, **args):
+    # records a complete event, start is a perf_counter() time
+    events.append({'name': name, 'cat': cat, 'ph': 'X', 'ts': round((start - START) * 1e6, 1),
+                   'dur': round(seconds * 1e6, 1), 'pid': os.getpid(), 'tid': threading.get_ident(), 'args': args})
+
+
+@contextmanager
+def span(name, cat, **args):
+    # records the block as an event
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        event(name, cat, start, perf_counter() - start, **args)
+
+
+def timed(cat):
+
+    # decorator recording every call as an event, the function is left as it is when tracing is off
+
+    def decorator(fn):
+        if not ENABLED: return fn
+
+        @wraps(fn)
+        def traced(*args, **kwargs):
+            with span(fn.__qualname__, cat):
+                return fn(*args, **kwargs)
+        return traced
+
+    return decorator
+
+
+class Totals:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.seconds = 0.0
+        self.max = 0.0
+        self.rows = 0
+
+    def record(self, seconds, rows=0):
+        with self.lock:
+            self.calls += 1
+            self.seconds += seconds
+            self.max = max(self.max, seconds)
+            self.rows += rows
+
+    def as_dict(self):
+        return {'calls': self.calls, 'total_ms': round(self.seconds * 1000, 3),
+                'mean_ms': round(self.seconds * 1000 / max(self.calls, 1), 3), 'max_ms': round(self.max * 1000, 3),
+                'rows': self.rows}
+
+
+# totals of every statement run, by sql
+statements = {}
+statements_lock = threading.Lock()
+
+# totals of the stalls of every window, by name
+stalls = {}
+
+
+def record_statement(sql, start, seconds, rows):
+    with statements_lock:
+        totals = statements.setdefault(sql, Totals())
+    totals.record(seconds, rows)
+    event(sql, 'sql', start, seconds, rows=rows)
+
+
+def statement_report():
+    # totals of every statement, the slowest in total first
+    with statements_lock:
+        items = sorted(statements.items(), key=lambda item: item[1].seconds, reverse=True)
+    return {sql: totals.as_dict() for sql, totals in items}
+
+
+class LagMonitor:
+
+    def __init__(self, widget, name, interval=HEARTBEAT, threshold=STALL):
+
+        """
+        schedules a heartbeat with after() every interval milliseconds, a heartbeat running more than
+        threshold milliseconds late means the event loop was busy with something else for that long
+        """
+
+        self.widget = widget
+        self.interval = interval / 1000
+        self.threshold = threshold / 1000
+        self.totals = stalls.setdefault(name, Totals())
+
+        self.expected = perf_counter() + self.interval
+        self.widget.after(interval, self.beat)
+
+    def beat(self):
+
+        now = perf_counter()
+        late = now - self.expected
+        if late > self.threshold:
+            self.totals.record(late)
+            event('stall', 'tk', self.expected, late)
+
+        self.expected = now + self.interval
+        self.widget.after(round(self.interval * 1000), self.beat)
+
+
+def dump(path=None):
+
+    # writes the events and totals, as a chrome trace
+    trace = {'traceEvents': list(events), 'displayTimeUnit': 'ms',
+             'otherData': {'statements': statement_report(),
+                           'stalls': {name: totals.as_dict() for name, totals in stalls.items()}}}
+
+    with open(path or TRACE_FILE, 'w') as f:
+        json.dump(trace, f)
+
+
+if ENABLED:
+    atexit.register(dump)
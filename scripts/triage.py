@@ -0,0 +1,208 @@
+import argparse
+import os
+from datetime import date, timedelta
+from operator import methodcaller
+
+from customtkinter import *
+
+from scripts.complaints import CATEGORIES
+from scripts.custom_widgets import WinTabView
+from scripts.database import ManagerRepository, QUEUES, STATUSES, PRIORITIES
+from scripts.scheduling import CAPACITY
+from scripts.shards import router, MANAGER_DB
+from scripts.worker import DBWorker
+
+"""
+ Triage dashboard for staff, the complaints and service bookings of every room in queues by status
+ each queue is most urgent first and oldest first within a priority, and can be narrowed down to a category
+ or service and a range of dates, pages are read from the indexes with keyset paging so a page costs the same
+ however much resolved history the database holds
+
+ clicking a row selects it, its priority, status and assignee are saved through a database worker
+ like every other write, and the queue is read again whenever the database changes
+
+ usage: python -m scripts.triage
+        python -m scripts.triage --db database/tower-a/manager_dat.db
+"""
+
+# rows on a page, and milliseconds between checks for changes made by the residents' windows
+PAGE = 12
+REFRESH_INTERVAL = 3000
+
+# filter value which shows everything
+ANY = 'Any'
+
+COLUMNS = {'complaints': ['priority', 'filed', 'room', 'subject', 'categories', 'assignee'],
+           'services': ['priority', 'scheduled', 'room', 'service', 'call', 'assignee']}
+OPTIONS = {'complaints': CATEGORIES, 'services': list(CAPACITY)}
+
+
+def display(table, row):
+
+    # values shown for a row of ManagerRepository.queue()
+    rowid, priority, day, room, name, detail, assignee, status = row
+    if table == 'complaints':
+        return PRIORITIES[priority], (day or '')[:10], room, name, detail or '', assignee or ''
+    return PRIORITIES[priority], day, room, name, 'Yes' if detail else 'No', assignee or ''
+
+
+class Triage(CTk):
+
+    def __init__(self, path):
+
+        # creating window with basic information
+        super().__init__()
+        self.geometry('900x600+80+60')
+        self.title('Triage')
+        self.resizable(False, False)
+
+        # the window reads with its own connection and saves through the worker's connection
+        self.db = ManagerRepository(path, readonly=True)
+        self.worker = DBWorker(self, lambda: ManagerRepository(path))
+        self.version = self.db.data_version()
+
+        # widgets and filters of each queue
+        self.queues = {}
+
+        self.tabs = WinTabView(self, width=880, height=580)
+        self.tabs.place(x=10, y=5)
+        for table in QUEUES:
+            self.tabs.add_tab(table.title(), builder=lambda tab, table=table: self.build_queue(tab, table))
+        self.tabs.build(self.tabs.get())
+
+        self.refreshing = self.after(REFRESH_INTERVAL, self.refresh)
+        self.protocol('WM_DELETE_WINDOW', self.exit)
+
+    def build_queue(self, tab, table):
+
+        q = self.queues[table] = {'status': STATUSES[0], 'filter': None, 'start': None, 'end': None, 'selected': None}
+
+        # filters, applied together
+        q['status_box'] = CTkComboBox(tab, values=list(STATUSES), width=130)
+        q['status_box'].place(x=10, y=10)
+        q['filter_box'] = CTkComboBox(tab, values=[ANY] + OPTIONS[table], width=150)
+        q['filter_box'].place(x=150, y=10)
+        q['start_box'] = CTkEntry(tab, width=120, placeholder_text='From YYYY-MM-DD')
+        q['start_box'].place(x=310, y=10)
+        q['end_box'] = CTkEntry(tab, width=120, placeholder_text='To YYYY-MM-DD')
+        q['end_box'].place(x=440, y=10)
+        CTkButton(tab, text='Apply', width=80, fg_color='#354545',
+                  command=lambda: self.apply(table)).place(x=570, y=10)
+        q['error'] = CTkLabel(tab, text='', text_color='#ff5555')
+        q['error'].place(x=660, y=10)
+
+        # the queue, rows are fetched a page at a time and clicking one selects it
+        q['table'] = tab.createtable(f'{table.title()} Queue', COLUMNS[table], 820, 360,
+                                     fetch=lambda before, limit: self.fetch(table, before, limit), page=PAGE,
+                                     command=lambda cell: self.select(table, cell['row']), x=10, y=50)
+
+        # the selected row's priority, status and assignee
+        q['label'] = CTkLabel(tab, text='Select a row to triage it', font=('Arial Bold', 14), width=200, anchor='w')
+        q['label'].place(x=10, y=480)
+        q['priority_box'] = CTkComboBox(tab, values=list(PRIORITIES.values()), width=110)
+        q['priority_box'].place(x=220, y=480)
+        q['new_status_box'] = CTkComboBox(tab, values=list(STATUSES), width=130)
+        q['new_status_box'].place(x=340, y=480)
+        q['assignee_box'] = CTkEntry(tab, width=160, placeholder_text='Assignee')
+        q['assignee_box'].place(x=480, y=480)
+        CTkButton(tab, text='Save', width=80, fg_color='#354545',
+                  command=lambda: self.save(table)).place(x=650, y=480)
+
+    def fetch(self, table, before, limit):
+
+        # a page of the queue, the key of every row is the row as it was read so the next page starts after it
+
+        q = self.queues[table]
+        filters = {QUEUES[table]: q['filter']} if q['filter'] else {}
+        rows = self.db.queue(table, before[0] if before else None, limit, q['status'], q['start'], q['end'],
+                             **filters)
+        return [(row, *display(table, row)) for row in rows]
+
+    def apply(self, table):
+
+        # reading the filters and going back to the first page, the end date is included in the range
+
+        q = self.queues[table]
+        try:
+            start, end = (date.fromisoformat(box.get()) if box.get() else None
+                          for box in (q['start_box'], q['end_box']))
+        except ValueError:
+            q['error'].configure(text='Dates are YYYY-MM-DD')
+            return
+        q['error'].configure(text='')
+
+        q['status'] = q['status_box'].get()
+        q['filter'] = None if q['filter_box'].get() == ANY else q['filter_box'].get()
+        q['start'] = str(start) if start else None
+        q['end'] = str(end + timedelta(days=1)) if end else None
+
+        q['table'].starts = [None]
+        q['table'].load()
+
+    def select(self, table, index):
+
+        # index 0 is the header row
+
+        q = self.queues[table]
+        if not 0 < index <= len(q['table'].shown): return
+
+        row = q['selected'] = q['table'].shown[index - 1][0]
+        q['label'].configure(text=f'{table[:-1].title()} {row[0]}, room {row[3]}')
+        q['priority_box'].set(PRIORITIES[row[1]])
+        q['new_status_box'].set(row[7])
+        q['assignee_box'].delete(0, 'end')
+        if row[6]:
+            q['assignee_box'].insert(0, row[6])
+
+    def save(self, table):
+
+        q = self.queues[table]
+        if not q['selected']: return
+
+        # anything typed into the boxes which is not a status or priority is refused by triage()
+        priority = {name: p for p, name in PRIORITIES.items()}.get(q['priority_box'].get())
+        self.worker.submit(methodcaller('triage', table, q['selected'][0], q['new_status_box'].get(), priority,
+                                        q['assignee_box'].get().strip()),
+                           callback=lambda result: self.saved(table),
+                           errback=lambda e: q['error'].configure(text=str(e)))
+
+    def saved(self, table):
+        # the row may have moved to another place or queue, so the page is read again
+        q = self.queues[table]
+        q['selected'] = None
+        q['label'].configure(text='Saved')
+        q['table'].load()
+
+    def refresh(self):
+
+        # reading the queues which are built again, only when someone has written to the database
+
+        version = self.db.data_version()
+        if version != self.version:
+            self.version = version
+            for q in self.queues.values():
+                q['table'].load()
+
+        self.refreshing = self.after(REFRESH_INTERVAL, self.refresh)
+
+    def exit(self):
+
+        # finishing queued saves before closing
+        self.after_cancel(self.refreshing)
+        self.worker.close()
+        self.db.close()
+        self.destroy()
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Triage complaints and service bookings of every room.')
+    parser.add_argument('--db', default=os.path.join(router.default, MANAGER_DB),
+                        help='manager database of the building, see database/shards.json for the others')
+    args = parser.parse_args()
+
+    Triage(args.db).mainloop()
+
+
+if __name__ == '__main__':
+    main()
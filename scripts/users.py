@@ -0,0 +1,112 @@
+import argparse
+import csv
+
+from scripts.database import UserRepository
+from scripts.shards import ShardedUserRepository, router
+from scripts.validation import SPECIAL, NUMBER, ALPHABET, PASSWORD_CHARS, ROOM_FORM, RECEIPT_FORM
+
+"""
+ Sign-up rules and bulk provisioning of residents
+ validate() holds the rules the sign-up window applies, so importing a csv of residents accepts exactly
+ the same users as signing them up one at a time
+
+ usage: python -m scripts.users residents.csv
+ the csv needs the columns room, receipt and password
+"""
+
+
+def validate(rno, pwd, rct, exists):
+
+    """
+    checking password validity in order
+    1. checking if all the entries are filled using all()
+    2. checking room number format
+    3. checking if room number already exists using exists(rno), after the format so a bad one is never looked up
+    4. checking password format
+    5. checking if password contains all needed characters, alphabet, number, symbol
+    6. checking if password contains only allowed characters
+    7. checking if receipt number is valid
+
+    :return: error message, empty if the user is valid
+    """
+
+    if not (all([rno, pwd, rct])):
+        return 'Please enter room number, password and receipt number.'
+
+    elif not ROOM_FORM.fullmatch(rno):
+        return 'Room number is of form "***L" \nWhere * is numeric and L is an alphabet'
+
+    elif exists(rno):
+        return 'Room number already registered.'
+
+    elif not (4 < len(pwd) <= 24):
+        return 'Password must be 5 to 24 characters long.'
+
+    elif not (SPECIAL.search(pwd) and NUMBER.search(pwd) and ALPHABET.search(pwd)):
+        return 'Password must be contain at least:\none special character, alphabet and number.'
+
+    elif not PASSWORD_CHARS.fullmatch(pwd):
+        return "Password must not contain characters other than \n!@$_, alphabets and numbers."
+
+    elif not RECEIPT_FORM.fullmatch(rct):
+        return 'Receipt Number must be a 10 digit numeric.'
+
+    return ''
+
+
+def provision(users, rows):
+
+    """
+    adds every valid resident in one transaction (one for every building), invalid rows are skipped
+    :param users: UserRepository, or ShardedUserRepository to add every resident to their own building
+    :param rows: iterable of (line, room, receipt, password)
+    :return: (number added, list of (line, room, error))
+    """
+
+    added = set()
+    failures = []
+
+    with users.batch():
+        for line, rno, rct, pwd in rows:
+
+            # rooms earlier in the same file count as registered
+            error = validate(rno, pwd, rct, lambda r: r in added or users.exists(r))
+            if error:
+                failures.append((line, rno, ' '.join(error.split())))
+                continue
+
+            users.add(rno, pwd)
+            added.add(rno)
+
+    return len(added), failures
+
+
+def read_csv(path):
+
+    # rows of the csv as (line, room, receipt, password), line 1 is the header
+
+    with open(path, newline='') as f:
+        for line, row in enumerate(csv.DictReader(f), 2):
+            yield line, (row.get('room') or '').strip(), (row.get('receipt') or '').strip(), row.get('password') or ''
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Sign up every resident in a csv file at once.')
+    parser.add_argument('csv', help='csv file with the columns room, receipt and password')
+    parser.add_argument('--db', help='users database, by default every room goes to its building\'s database')
+    args = parser.parse_args()
+
+    users = UserRepository(args.db) if args.db else ShardedUserRepository(router)
+    try:
+        added, failures = provision(users, read_csv(args.csv))
+    finally:
+        users.close()
+
+    for line, rno, error in failures:
+        print(f'line {line} ({rno or "no room"}): {error}')
+    print(f'{added} residents added, {len(failures)} rows rejected')
+
+
+if __name__ == '__main__':
+    main()
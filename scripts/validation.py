@@ -0,0 +1,88 @@
+import re
+
+"""
+ Input validation, the rules of every input are declared once as a Field and used by the widgets and by sign-up
+ character classes are compiled once, so checking a keystroke only looks at the characters being inserted
+ and checking a whole value is a few regex searches instead of loops over strings of allowed characters
+
+ Field.accepts : checks an insert as it is typed, characters outside the field's class or past its limit are refused
+ Field.check : checks a whole value against the field's rules, returns the message of the first rule it breaks
+ Debounce : runs a function once typing stops, so whole value checks are not run on every key
+"""
+
+SPECIAL = re.compile(r'[!@$_]')
+NUMBER = re.compile(r'[0-9]')
+ALPHABET = re.compile(r'[A-Za-z]')
+
+# every character a password may have
+PASSWORD_CHARS = re.compile(r'[!@$_0-9A-Za-z]*')
+
+ROOM_FORM = re.compile(r'[0-9]{3}[A-Z]')
+RECEIPT_FORM = re.compile(r'[0-9]{10}')
+
+# milliseconds typing has to stop for before a value is checked
+DEBOUNCE = 300
+
+
+class Field:
+
+    def __init__(self, allowed=None, limit=None, rules=()):
+
+        """
+        :param allowed: compiled character class every typed character has to match, None allows anything
+        :param limit: most characters the value can have, None for no limit
+        :param rules: (test, message) pairs checked in order, test is a compiled pattern the whole value
+                      has to match or a function returning True for a valid value
+        """
+
+        self.allowed = re.compile(f'(?:{allowed.pattern})*') if allowed else None
+        self.limit = limit
+        self.rules = rules
+
+    def accepts(self, inserted, length):
+
+        # checks an insert, length is how long the value would be with it
+        if self.limit and length > self.limit:
+            return False
+        return self.allowed is None or self.allowed.fullmatch(inserted) is not None
+
+    def check(self, value):
+
+        # message of the first rule the value breaks, empty if it breaks none
+        for test, message in self.rules:
+            if not (test.fullmatch(value) if isinstance(test, re.Pattern) else test(value)):
+                return message
+        return ''
+
+
+ROOM = Field(re.compile(r'[0-9A-Za-z]'), 4, [(ROOM_FORM, 'Form is ***L')])
+PASSWORD = Field(re.compile(r'[!@$_0-9A-Za-z]'), 24, [
+    (lambda v: len(v) > 4, 'Too short'),
+    (SPECIAL.search, 'Needs one of !@$_'),
+    (NUMBER.search, 'Needs a number'),
+    (ALPHABET.search, 'Needs a letter'),
+])
+RECEIPT = Field(re.compile(r'[0-9]'), 10, [(RECEIPT_FORM, '10 digits')])
+
+# complaint subjects are varchar(100)
+SUBJECT = Field(limit=100)
+
+
+class Debounce:
+
+    def __init__(self, widget, fn, delay=DEBOUNCE):
+
+        # fn is called delay milliseconds after the last call, widget is used for after()
+        self.widget = widget
+        self.fn = fn
+        self.delay = delay
+        self.pending = None
+
+    def __call__(self, *args):
+        if self.pending:
+            self.widget.after_cancel(self.pending)
+        self.pending = self.widget.after(self.delay, self.run, *args)
+
+    def run(self, *args):
+        self.pending = None
+        self.fn(*args)
@@ -0,0 +1,130 @@
+import sys
+from queue import Queue, Empty
+from threading import Thread
+
+from scripts.connections import is_locked, retry
+
+"""
+ Database worker, writes run on their own thread so a busy database never freezes the window
+ jobs waiting in the queue are run together in one transaction, each job in its own savepoint
+ results are handed back to the Tk thread with after(), where the callbacks run
+"""
+
+
+class DBWorker(Thread):
+
+    def __init__(self, widget, opener, batch=32, interval=20):
+
+        """
+        :param widget: any widget of the window, used to poll for results with after()
+        :param opener: function returning a repository, called on the worker thread since
+                       sqlite connections can only be used by the thread which opened them,
+                       the repository needs batch() returning a context grouping writes and close()
+        :param batch: most jobs put into one transaction
+        :param interval: milliseconds between checks for results
+        """
+
+        super().__init__(daemon=True)
+
+        self.widget = widget
+        self.opener = opener
+        self.batch = batch
+        self.interval = interval
+
+        self.jobs = Queue()
+        self.results = Queue()
+
+        self.start()
+        self.poll()
+
+    def submit(self, fn, *args, callback=None, errback=None):
+
+        """
+        queues fn(repository, *args) to run on the worker
+        callback(result) or errback(exception) is called on the Tk thread once the transaction is committed
+        """
+
+        self.jobs.put((fn, args, callback, errback))
+
+    def run(self):
+
+        # opening again while the database is locked, e.g. by a window running the migrations
+        try:
+            repo = retry(self.opener)
+        except Exception as e:
+            self.fail(e)
+            return
+
+        while True:
+
+            # waiting for a job and taking whatever else is queued up to the batch size
+            jobs = [self.jobs.get()]
+            while len(jobs) < self.batch:
+                try:
+                    jobs.append(self.jobs.get_nowait())
+                except Empty:
+                    break
+
+            stop = None in jobs
+            jobs = [job for job in jobs if job is not None]
+
+            try:
+                # the whole batch runs again if the database stays locked
+                done = retry(self.run_batch, repo, jobs, stats=getattr(repo, 'stats', None))
+            except Exception as e:
+                # commit failed, nothing in the batch was written
+                done = [(errback, e) for fn, args, callback, errback in jobs]
+
+            for result in done:
+                self.results.put(result)
+
+            if stop: break
+
+        repo.close()
+
+    def fail(self, error):
+
+        # the repository could not be opened, every job queued and submitted later gets the error until closed
+        while (job := self.jobs.get()) is not None:
+            fn, args, callback, errback = job
+            self.results.put((errback, error))
+
+    @staticmethod
+    def run_batch(repo, jobs):
+
+        # running the jobs in one transaction, returns (callback, result) or (errback, exception) for each job
+
+        done = []
+        with repo.batch():
+            for fn, args, callback, errback in jobs:
+                try:
+                    done.append((callback, fn(repo, *args)))
+                except Exception as e:
+                    if is_locked(e): raise
+                    done.append((errback, e))
+        return done
+
+    def poll(self):
+
+        # running the callbacks of finished jobs on the Tk thread
+        # a callback which raises is reported like any other Tk callback and the rest still run
+
+        try:
+            while True:
+                try:
+                    callback, result = self.results.get_nowait()
+                except Empty:
+                    break
+                try:
+                    if callback: callback(result)
+                except Exception:
+                    self.widget.report_callback_exception(*sys.exc_info())
+        finally:
+            self.polling = self.widget.after(self.interval, self.poll)
+
+    def close(self):
+
+        # finishing every queued job and stopping the thread and the polling, callbacks still waiting are dropped
+        self.jobs.put(None)
+        self.join()
+        self.widget.after_cancel(self.polling)
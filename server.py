@@ -0,0 +1,266 @@
+import argparse
+import asyncio
+import json
+import os
+import sqlite3
+import traceback
+from functools import partial
+from urllib.parse import urlsplit, parse_qsl
+
+from scripts.backup import BackupThread
+from scripts.connections import lock_report, retry
+from scripts.database import ManagerRepository, UserRepository, ARCHIVE_BATCH
+from scripts.scheduling import FullyBooked
+from scripts.users import validate
+
+"""
+ Headless server, exposes the apartment operations over a small local http api so windows can run as thin clients
+ instead of every window opening the database files itself
+
+ reads are spread over a pool of read only connections, writes go through a single writer connection one at a time
+ every request and response body is json, rows are sent as lists
+
+ usage: python server.py --port 8080
+        python main.py --server http://127.0.0.1:8080
+"""
+
+# seconds between moving old forum messages to the archive
+ARCHIVE_INTERVAL = 3600
+
+
+class Pool:
+
+    def __init__(self, opener, size):
+
+        # connections are used from the executor's threads, one thread at a time
+        # the writer is opened first so it runs the migrations, readers cannot write
+        self.writer = opener(check_same_thread=False)
+        self.write_lock = asyncio.Lock()
+
+        # counts the writes made, clients poll it to know when to read again
+        self.writes = 0
+
+        self.free = asyncio.Queue()
+        for _ in range(size):
+            self.free.put_nowait(opener(check_same_thread=False, readonly=True))
+
+    async def read(self, fn, *args):
+        # runs fn(repository, *args) on a free connection
+        repo = await self.free.get()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(None, fn, repo, *args)
+        finally:
+            self.free.put_nowait(repo)
+
+    async def write(self, fn, *args):
+        # runs fn(repository, *args) on the writer connection, in a transaction which is retried while locked
+        async with self.write_lock:
+            try:
+                return await asyncio.get_running_loop().run_in_executor(
+                    None, partial(retry, self.in_batch, fn, args, stats=self.writer.stats))
+            finally:
+                self.writes += 1
+
+    def in_batch(self, fn, args):
+        with self.writer.batch():
+            return fn(self.writer, *args)
+
+
+class Server:
+
+    def __init__(self, manager_path, users_path, size):
+
+        self.manager = Pool(lambda **kw: ManagerRepository(manager_path, **kw), size)
+        self.users = Pool(lambda **kw: UserRepository(users_path, **kw), size)
+
+        # task moving old forum messages to the archive, started by serve()
+        self.archiver = None
+
+        # (method, path) : handler(query, body)
+        self.routes = {
+            ('POST', '/login'): self.login,
+            ('POST', '/users'): self.sign_up,
+            ('GET', '/users'): self.user_exists,
+            ('GET', '/history'): self.history,
+            ('POST', '/services'): self.add_service,
+            ('POST', '/complaints'): self.add_complaint,
+            ('GET', '/forum'): self.forum,
+            ('POST', '/forum'): self.add_message,
+            ('GET', '/forum/since'): self.forum_since,
+            ('GET', '/forum/last'): self.forum_last,
+            ('GET', '/search/forum'): self.search_forum,
+            ('GET', '/search/complaints'): self.search_complaints,
+            ('GET', '/services/full'): self.full_days,
+            ('GET', '/version'): self.version,
+            ('GET', '/stats'): self.stats,
+        }
+
+    # handlers
+
+    async def login(self, query, body):
+        return {'ok': await self.users.read(UserRepository.check, body['room'], body['password'])}
+
+    async def user_exists(self, query, body):
+        return {'exists': await self.users.read(UserRepository.exists, query['room'])}
+
+    async def sign_up(self, query, body):
+
+        # same rules as the sign-up window, a room registered in the meantime fails on the primary key
+        error = await self.users.read(lambda users: validate(body['room'], body['password'], body['receipt'],
+                                                             users.exists))
+        if error:
+            raise ValueError(error)
+
+        await self.users.write(UserRepository.add, body['room'], body['password'])
+        return {'ok': True}
+
+    async def history(self, query, body):
+        return await self.manager.read(ManagerRepository.history_page, query['room'], self.before(query),
+                                       int(query.get('limit', 10)))
+
+    async def full_days(self, query, body):
+        return await self.manager.read(ManagerRepository.full_days, query['service'], query['start'], query['end'])
+
+    async def version(self, query, body):
+        # changes whenever something is written, like PRAGMA data_version for a local connection
+        return self.manager.writes
+
+    async def add_service(self, query, body):
+        return await self.manager.write(ManagerRepository.add_service, body['room'], body['service'],
+                                        body['sched'], bool(body['call']))
+
+    async def add_complaint(self, query, body):
+        return await self.manager.write(ManagerRepository.add_complaint, body['room'], body['cat'],
+                                        body['sub'], body['con'])
+
+    async def forum(self, query, body):
+        return await self.manager.read(ManagerRepository.forum_page, self.before(query), int(query.get('limit', 50)))
+
+    async def add_message(self, query, body):
+        return await self.manager.write(ManagerRepository.add_message, body['room'], body['con'])
+
+    async def forum_since(self, query, body):
+        return await self.manager.read(ManagerRepository.forum_since, int(query.get('rowid', 0)),
+                                       int(query.get('limit', 100)))
+
+    async def forum_last(self, query, body):
+        return await self.manager.read(ManagerRepository.forum_last)
+
+    async def search_forum(self, query, body):
+        return await self.manager.read(ManagerRepository.search_forum, query['q'], int(query.get('offset', 0)),
+                                       int(query.get('limit', 10)))
+
+    async def search_complaints(self, query, body):
+        return await self.manager.read(ManagerRepository.search_complaints, query['room'], query['q'],
+                                       int(query.get('offset', 0)), int(query.get('limit', 10)))
+
+    async def stats(self, query, body):
+        # lock statistics, to see how contended the databases are
+        return lock_report()
+
+    async def archive_forum(self, interval=ARCHIVE_INTERVAL):
+
+        # moving old forum messages to the archive a batch at a time, so requests are only held up for one batch
+        while True:
+            while await self.manager.write(ManagerRepository.archive_forum) == ARCHIVE_BATCH:
+                pass
+            await asyncio.sleep(interval)
+
+    @staticmethod
+    def before(query):
+        # row to page from, sent as json
+        return json.loads(query['before']) if query.get('before') else None
+
+    # http
+
+    async def handle(self, reader, writer):
+
+        # serving requests on the connection until the client closes it
+
+        try:
+            while True:
+                line = await reader.readline()
+                if not line: break
+
+                method, target, _ = line.decode().split(' ', 2)
+                headers = {}
+                while (line := await reader.readline()) not in (b'\r\n', b'\n', b''):
+                    key, value = line.decode().split(':', 1)
+                    headers[key.strip().lower()] = value.strip()
+
+                length = int(headers.get('content-length', 0))
+                body = json.loads(await reader.readexactly(length)) if length else {}
+
+                status, result = await self.dispatch(method, target, body)
+                data = json.dumps(result).encode()
+
+                writer.write(f'HTTP/1.1 {status}\r\nContent-Type: application/json\r\n'
+                             f'Content-Length: {len(data)}\r\n\r\n'.encode() + data)
+                await writer.drain()
+
+                if headers.get('connection', '').lower() == 'close': break
+
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def dispatch(self, method, target, body):
+
+        # finding the handler and turning errors into status codes
+
+        url = urlsplit(target)
+        handler = self.routes.get((method, url.path))
+        if handler is None:
+            return '404 Not Found', {'error': 'not found'}
+
+        try:
+            return '200 OK', await handler(dict(parse_qsl(url.query)), body)
+        except (sqlite3.IntegrityError, FullyBooked) as e:
+            return '409 Conflict', {'error': str(e)}
+        except (KeyError, ValueError, TypeError) as e:
+            return '400 Bad Request', {'error': str(e)}
+        except Exception as e:
+            # anything else is a bug, the client is still answered and the traceback is printed for whoever runs it
+            traceback.print_exc()
+            return '500 Internal Server Error', {'error': f'{type(e).__name__}: {e}'}
+
+
+async def serve(host, port, manager_path, users_path, size):
+
+    server = Server(manager_path, users_path, size)
+    tcp = await asyncio.start_server(server.handle, host, port)
+    # archiving in the background, the task is kept on the server so it is not garbage collected
+    server.archiver = asyncio.create_task(server.archive_forum())
+
+    # daily snapshots of the databases, made on their own thread
+    # --users can be in another folder, so both databases are passed by their path
+    backups = BackupThread(os.path.dirname(manager_path) or '.',
+                           databases={'manager_dat.db': manager_path, 'users.db': users_path})
+    print(f'Serving on http://{host}:{port}', flush=True)
+
+    try:
+        async with tcp:
+            await tcp.serve_forever()
+    finally:
+        # stopping the archiver on shutdown, a batch already being moved still finishes on its thread
+        server.archiver.cancel()
+        await asyncio.gather(server.archiver, return_exceptions=True)
+        backups.stop()
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Serve the apartment databases over a local http api.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--db', default='database/manager_dat.db')
+    parser.add_argument('--users', default='database/users.db')
+    parser.add_argument('--pool', type=int, default=4, help='read connections per database')
+    args = parser.parse_args()
+
+    asyncio.run(serve(args.host, args.port, args.db, args.users, args.pool))
+
+
+if __name__ == '__main__':
+    main()
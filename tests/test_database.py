@@ -0,0 +1,259 @@
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import unittest
+from datetime import date, timedelta
+
+from scripts.database import ManagerRepository, UserRepository, MANAGER_MIGRATIONS, USER_MIGRATIONS, migrate
+
+"""
+ Data layer, the schema migrations, keyset paging of the history and the forum (into the archive as well),
+ the one time complaints.json import and the order of the triage queues
+
+ usage: python -m unittest tests.test_database
+"""
+
+ROOM = '101A'
+
+# tables of a manager_dat.db from before the repository, with a row in each
+OLD_SCHEMA = [
+    'CREATE TABLE requests(type varchar(20), room char(4), date datetime, req varchar(20))',
+    'CREATE TABLE services(service varchar(20), room char(4), date datetime, sched datetime, call bool)',
+    'CREATE TABLE forum(room char(4), date datetime, con varchar(200))',
+    "INSERT INTO requests VALUES ('service', '101A', '2020-01-05', 'Plumbing')",
+    "INSERT INTO services VALUES ('Plumbing', '101A', '2020-01-05', '2020-01-06', 0)",
+    "INSERT INTO forum VALUES ('101A', '2020-01-05 10:00:00', 'hello')",
+]
+
+
+class DatabaseTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'manager_dat.db')
+        self.repos = []
+
+    def tearDown(self):
+        for repo in self.repos:
+            repo.close()
+        self.tmp.cleanup()
+
+    def open(self, **kwargs):
+        repo = ManagerRepository(self.path, **kwargs)
+        self.repos.append(repo)
+        return repo
+
+    def version(self, repo):
+        return repo.dbcon.execute('PRAGMA user_version').fetchone()[0]
+
+
+class MigrationTest(DatabaseTest):
+
+    def test_new_database(self):
+        db = self.open()
+        self.assertEqual(self.version(db), len(MANAGER_MIGRATIONS))
+
+        users = UserRepository(os.path.join(self.tmp.name, 'users.db'))
+        self.repos.append(users)
+        self.assertEqual(users.dbcon.execute('PRAGMA user_version').fetchone()[0], len(USER_MIGRATIONS))
+
+    def test_old_database(self):
+
+        # the rows of a database from before the migrations are carried into the summaries and the indexes
+
+        dbcon = sqlite3.connect(self.path)
+        for statement in OLD_SCHEMA:
+            dbcon.execute(statement)
+        dbcon.commit()
+        dbcon.close()
+
+        db = self.open()
+        self.assertEqual(self.version(db), len(MANAGER_MIGRATIONS))
+        self.assertEqual(db.request_counts(('type', 'month')), [('service', '2020-01', 1)])
+        self.assertEqual(db.service_volumes(), [('Plumbing', '2020-01', 1)])
+        self.assertEqual([row[0] for row in db.search_forum('hel')], [1])
+        # the service was carried out long ago, so it is not in the open queue
+        self.assertEqual(db.queue('services'), [])
+        self.assertEqual(len(db.queue('services', status='resolved')), 1)
+
+    def test_part_migrated(self):
+
+        # only the migrations newer than the database's version run
+
+        dbcon = sqlite3.connect(self.path)
+        for statement in MANAGER_MIGRATIONS[0] + MANAGER_MIGRATIONS[1]:
+            dbcon.execute(statement)
+        dbcon.execute('PRAGMA user_version = 2')
+        dbcon.commit()
+        dbcon.close()
+
+        db = self.open()
+        self.assertEqual(self.version(db), len(MANAGER_MIGRATIONS))
+        self.assertEqual(migrate(db.dbcon, MANAGER_MIGRATIONS), len(MANAGER_MIGRATIONS))
+
+    def test_concurrent(self):
+
+        # windows opening a new database at the same time, each migration runs in one of them only
+
+        errors = []
+
+        def open_database():
+            try:
+                ManagerRepository(self.path).close()
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=open_database) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(self.version(self.open()), len(MANAGER_MIGRATIONS))
+
+
+class PagingTest(DatabaseTest):
+
+    def page_through(self, page, limit):
+        # every row, a page at a time from the last row of the page before
+        rows, before = [], None
+        while found := page(before, limit):
+            rows += found
+            before = found[-1]
+        return rows
+
+    def test_history(self):
+
+        db = self.open()
+        # several requests on the same day, so the rowid decides their order
+        for i in range(13):
+            db.dbcon.execute("INSERT INTO requests VALUES ('service', ?, ?, 'Plumbing')",
+                             (ROOM, str(date(2024, 1, 1) + timedelta(days=i // 3))))
+        db.dbcon.execute("INSERT INTO requests VALUES ('service', '102B', '2024-01-02', 'Plumbing')")
+
+        rows = self.page_through(lambda before, limit: db.history_page(ROOM, before, limit), 4)
+        self.assertEqual(len(rows), 13)
+        self.assertEqual(rows, sorted(rows, key=lambda r: (r[1], r[0]), reverse=True))
+
+    def test_forum_into_archive(self):
+
+        db = self.open()
+        for i in range(30):
+            db.dbcon.execute('INSERT INTO forum VALUES (?, ?, ?)',
+                             (ROOM, f'{date(2023, 1, 1) + timedelta(days=i * 20)} 10:00:00', f'message {i}'))
+        everything = db.forum_page(None, 100)
+
+        # moving the older messages in small batches, the page carries on into the archive where the forum ends
+        while db.archive_forum('2024-01-01', limit=4) == 4:
+            pass
+        archived, = db.dbcon.execute('SELECT count(*) FROM forum_archive').fetchone()
+        self.assertTrue(0 < archived < 30)
+
+        for limit in (1, 4, 7):
+            self.assertEqual(self.page_through(db.forum_page, limit), everything)
+
+
+class ComplaintImportTest(DatabaseTest):
+
+    def write_legacy(self, n):
+        complaints = {f'c{i}': {'room': ROOM, 'cat': ['Noise'], 'sub': f'complaint {i}', 'con': 'loud'}
+                      for i in range(n)}
+        with open(os.path.join(self.tmp.name, 'complaints.json'), 'w') as f:
+            json.dump(complaints, f)
+
+    def subjects(self, db):
+        return [s for s, in db.dbcon.execute('SELECT sub FROM complaints ORDER BY id')]
+
+    def test_import(self):
+
+        # c10 comes after c9, the keys are sorted by their number
+        self.write_legacy(12)
+        db = self.open()
+        self.assertEqual(self.subjects(db), [f'complaint {i}' for i in range(12)])
+        self.assertFalse(os.path.exists(os.path.join(self.tmp.name, 'complaints.json')))
+        self.assertTrue(os.path.exists(os.path.join(self.tmp.name, 'complaints.json.migrated')))
+        self.assertEqual(db.complaint_counts(), [('Noise', 12)])
+
+        # opening again imports nothing
+        self.assertEqual(len(self.subjects(self.open())), 12)
+
+    def test_readonly(self):
+
+        # reports and readers leave the file for a connection which writes to import
+        self.write_legacy(3)
+        self.assertEqual(self.subjects(self.open(readonly=True)), [])
+        self.assertTrue(os.path.exists(os.path.join(self.tmp.name, 'complaints.json')))
+        self.assertEqual(len(self.subjects(self.open())), 3)
+
+    def test_concurrent(self):
+
+        self.write_legacy(50)
+        errors = []
+
+        def open_database():
+            try:
+                ManagerRepository(self.path).close()
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=open_database) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(self.subjects(self.open())), 50)
+
+
+class QueueTest(DatabaseTest):
+
+    def test_complaints(self):
+
+        db = self.open()
+        for i, (priority, cat) in enumerate([(3, 'Noise'), (1, 'Pest'), (3, 'Pest'), (2, 'Noise'), (1, 'Noise')]):
+            db.add_complaint(ROOM, [cat], f'complaint {i}', 'text')
+            db.triage('complaints', i + 1, 'open', priority)
+        db.triage('complaints', 3, 'resolved', 3)
+
+        # most urgent first, the oldest first within a priority, resolved ones left out
+        rows = db.queue('complaints')
+        self.assertEqual([(r[0], r[1]) for r in rows], [(2, 1), (5, 1), (4, 2), (1, 3)])
+        self.assertEqual(rows[0][5], 'Pest')
+
+        # pages carry on after the last row of the page before
+        first = db.queue('complaints', limit=2)
+        self.assertEqual(first + db.queue('complaints', after=first[-1], limit=10), rows)
+
+        self.assertEqual([r[0] for r in db.queue('complaints', cat='Noise')], [5, 4, 1])
+        self.assertEqual([r[0] for r in db.queue('complaints', status='resolved')], [3])
+        with self.assertRaises(ValueError):
+            db.queue('complaints', service='Plumbing')
+
+    def test_services(self):
+
+        db = self.open()
+        today = date.today()
+        bookings = [('Plumbing', 5, 3), ('Electrical', 2, 3), ('Plumbing', 1, 3), ('Plumbing', 3, 1)]
+        for service, days, priority in bookings:
+            db.add_service(ROOM, service, str(today + timedelta(days=days)), False)
+        for rowid, (service, days, priority) in enumerate(bookings, 1):
+            db.triage('services', rowid, 'open', priority)
+
+        # by priority, then the soonest scheduled
+        rows = db.queue('services')
+        self.assertEqual([r[0] for r in rows], [4, 3, 2, 1])
+
+        first = db.queue('services', limit=3)
+        self.assertEqual(first + db.queue('services', after=first[-1]), rows)
+
+        self.assertEqual([r[0] for r in db.queue('services', service='Plumbing')], [4, 3, 1])
+        self.assertEqual([r[0] for r in db.queue('services', start=str(today + timedelta(days=2)),
+                                                 end=str(today + timedelta(days=5)))], [4, 2])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+import asyncio
+import os
+import tempfile
+import threading
+import unittest
+from datetime import date, timedelta
+
+from scripts.client import RemoteManagerRepository
+from scripts.database import ManagerRepository
+from scripts.models import Pages, Post, Request
+from server import Server
+
+"""
+ Paging through the server, the same way the windows do with --server
+ cursors are sent to the server as json, so a page has to carry on from a plain row and not a Record
+
+ usage: python -m unittest tests.test_remote_paging
+"""
+
+ROOM = '101A'
+MESSAGES = 23
+SERVICES = 17
+PAGE = 5
+
+
+class RemotePagingTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+
+        cls.tmp = tempfile.TemporaryDirectory()
+        manager_path = os.path.join(cls.tmp.name, 'manager_dat.db')
+        users_path = os.path.join(cls.tmp.name, 'users.db')
+
+        db = ManagerRepository(manager_path)
+        for i in range(MESSAGES):
+            db.add_message(ROOM, f'message {i}')
+        for i in range(SERVICES):
+            db.add_service(ROOM, 'Plumbing', str(date.today() + timedelta(days=i + 1)), False)
+        db.close()
+
+        # the server on its own event loop, on a free port
+        cls.loop = asyncio.new_event_loop()
+        started = threading.Event()
+
+        async def start():
+            cls.server = Server(manager_path, users_path, 2)
+            cls.tcp = await asyncio.start_server(cls.server.handle, '127.0.0.1', 0)
+            started.set()
+
+        cls.thread = threading.Thread(target=lambda: (cls.loop.run_until_complete(start()), cls.loop.run_forever()),
+                                      daemon=True)
+        cls.thread.start()
+        started.wait(10)
+
+        port = cls.tcp.sockets[0].getsockname()[1]
+        cls.remote = RemoteManagerRepository(f'http://127.0.0.1:{port}')
+        cls.local = ManagerRepository(manager_path, readonly=True)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.remote.close()
+        cls.local.close()
+
+        async def stop():
+            # closing the listener, the connections end by themselves now the client has closed its side
+            cls.tcp.close()
+            await cls.tcp.wait_closed()
+            handlers = asyncio.all_tasks() - {asyncio.current_task()}
+            if handlers:
+                await asyncio.wait(handlers, timeout=10)
+
+        asyncio.run_coroutine_threadsafe(stop(), cls.loop).result(10)
+        cls.loop.call_soon_threadsafe(cls.loop.stop)
+        cls.thread.join(10)
+        cls.loop.close()
+        cls.tmp.cleanup()
+
+    @staticmethod
+    def page_through(pages):
+        # every record, a page at a time from the last record of the page before, as the chat and history do
+        records, before = [], None
+        while page := pages.page(before, PAGE):
+            records += page
+            before = page[-1]
+        return records
+
+    def test_forum(self):
+        records = self.page_through(Pages(self.remote.forum_page, Post))
+        self.assertEqual([tuple(r) for r in records], self.local.forum_page(None, MESSAGES + 1))
+        self.assertEqual(len(records), MESSAGES)
+
+    def test_history(self):
+        records = self.page_through(Pages(lambda before, limit: self.remote.history_page(ROOM, before, limit),
+                                          Request))
+        self.assertEqual([tuple(r) for r in records], self.local.history_page(ROOM, None, SERVICES + 1))
+        self.assertEqual(len(records), SERVICES)
+
+    def test_uncached(self):
+        # a record which is not in the cache is paged from by asking the server straight away
+        cached = Pages(self.remote.forum_page, Post).page(None, PAGE)
+        pages = Pages(self.remote.forum_page, Post)
+        self.assertEqual([tuple(r) for r in pages.page(cached[-1], PAGE)],
+                         self.local.forum_page(tuple(cached[-1]), PAGE))
+        self.assertEqual(pages.records, [])
+
+
+if __name__ == '__main__':
+    unittest.main()